@@ -0,0 +1,137 @@
+#!/usr/bin/env python3.6
+# -*- coding: utf-8 -*- pyversions=3.6+
+
+"""
+End-to-end benchmark of SMSCMDDaemon against the local modem simulator.
+
+    python benchmarks/bench_daemon.py --messages 200 --burst 10 --interval 0.5 --mode async
+
+Reports processed messages per second, reply latency percentiles and HTTP
+requests made to the modem per message.
+"""
+
+import logging
+import re
+import tempfile
+import threading
+import time
+from argparse import ArgumentParser
+
+from sms.simulator import ModemSimulator
+from sms.sms_cmd import SMSCMDDaemon
+
+PHONE = '+34666666666'
+FINISHED = re.compile(r'Command executed: req-(\d+)')
+STARTED = re.compile(r'Executing command: echo req-(\d+)')
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return float('nan')
+
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def build_config(args, url, workdir):
+    config = {
+        'service': {'path_pidfile': workdir, 'time': args.poll_max, 'start_timeout': 10, 'mode': args.mode,
+                    'poll': {'min': args.poll_min, 'max': args.poll_max, 'decay': 2}},
+        'modem': {'url': url, 'timeout': 5},
+        'phones': {'authorized': [PHONE], 'alerts': [PHONE]},
+        'commands': {
+            'exec': {
+                'msg': {
+                    'started': 'Executing command: {command_cli}',
+                    'finished': 'Command executed: {command_output}'
+                },
+                'timeout': 30
+            }
+        }
+    }
+    if args.journal:
+        config['journal'] = {'path': workdir + '/journal.log'}
+
+    return config
+
+
+def send_traffic(args, simulator, daemon, injected):
+    sent = 0
+    while sent < args.messages:
+        burst = min(args.burst, args.messages - sent)
+        now = time.monotonic()
+        for n in range(sent, sent + burst):
+            injected[n] = now
+            simulator.state.inject(PHONE, 'exec echo req-%s' % n)
+        sent += burst
+        time.sleep(args.interval)
+
+    deadline = time.monotonic() + args.timeout
+    while time.monotonic() < deadline:
+        with simulator.state.lock:
+            finished = sum(1 for _, _, text in simulator.state.sent if FINISHED.match(text))
+        if finished >= args.messages:
+            break
+        time.sleep(0.05)
+
+    daemon._active = False
+
+
+def report(args, simulator, injected):
+    first_reply, last_reply = {}, {}
+    for sent_at, _, text in simulator.state.sent:
+        for pattern, replies in ((STARTED, first_reply), (FINISHED, last_reply)):
+            match = pattern.match(text)
+            if match:
+                replies.setdefault(int(match.group(1)), sent_at)
+
+    completed = len(last_reply)
+    elapsed = max(last_reply.values()) - min(injected.values()) if completed else float('nan')
+    first_latency = [first_reply[n] - injected[n] for n in first_reply]
+    last_latency = [last_reply[n] - injected[n] for n in last_reply]
+
+    print("mode:                  %s" % args.mode)
+    print("messages:              %s/%s completed" % (completed, args.messages))
+    print("throughput:            %.2f msg/s" % (completed / elapsed if completed else 0))
+    for name, latency in (('first reply', first_latency), ('final reply', last_latency)):
+        print("%-22s p50 %.3fs  p90 %.3fs  p99 %.3fs  max %.3fs" % (
+            name + ' latency:', percentile(latency, 50), percentile(latency, 90), percentile(latency, 99),
+            max(latency) if latency else float('nan')))
+    print("modem requests:        %s (%s errors)" % (simulator.state.requests, simulator.state.errors))
+    print("modem calls / message: %.2f" % (simulator.state.requests / args.messages))
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--messages", help="Número de SMS enviados al demonio", default=100, type=int)
+    parser.add_argument("--burst", help="SMS que llegan a la vez", default=5, type=int)
+    parser.add_argument("--interval", help="Segundos entre ráfagas de SMS", default=0.5, type=float)
+    parser.add_argument("--mode", help="Modo de ejecución del demonio", default='async', choices=['sync', 'async'])
+    parser.add_argument("--latency", help="Latencia de cada petición al modem en segundos", default=0.02, type=float)
+    parser.add_argument("--error-rate", help="Proporción de peticiones al modem que fallan", default=0, type=float)
+    parser.add_argument("--poll-min", help="Intervalo mínimo de consulta del buzón", default=0.1, type=float)
+    parser.add_argument("--poll-max", help="Intervalo máximo de consulta del buzón", default=2, type=float)
+    parser.add_argument("--journal", help="Activa el diario de SMS procesados", action='store_true')
+    parser.add_argument("--timeout", help="Segundos máximos de espera a las respuestas", default=120, type=float)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    with ModemSimulator(latency=args.latency, error_rate=args.error_rate) as simulator, \
+            tempfile.TemporaryDirectory() as workdir:
+        daemon = SMSCMDDaemon(config=build_config(args, simulator.url, workdir))
+        daemon._active = True
+        injected = {}
+        traffic = threading.Thread(target=send_traffic, args=(args, simulator, daemon, injected), daemon=True)
+        traffic.start()
+        try:
+            daemon.run()
+        except SystemExit:
+            print("Daemon stopped by an error, results are partial")
+        traffic.join(timeout=1)
+
+        report(args, simulator, injected)
+
+
+if __name__ == "__main__":
+    main()
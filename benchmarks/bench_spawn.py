@@ -0,0 +1,69 @@
+#!/usr/bin/env python3.6
+# -*- coding: utf-8 -*- pyversions=3.6+
+
+"""
+Spawn latency of the command backends, from the daemon's point of view.
+
+    python benchmarks/bench_spawn.py --runs 200 --ballast-mb 64
+
+The ballast grows the resident memory of this process, as the daemon grows on
+the buoy, because the cost of fork grows with the page tables to copy.
+'check_output' is the launcher used before the spawn backends were added.
+"""
+
+import os
+import time
+from argparse import ArgumentParser
+from subprocess import check_output
+
+from sms.process import POSIX_SPAWN, SUBPROCESS, capture_output
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def measure(run, runs):
+    run()
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+
+    return timings
+
+
+def launchers(command):
+    cli = command.split()
+    yield 'check_output shell', lambda: check_output(command, shell=True)
+    for backend in (SUBPROCESS, POSIX_SPAWN):
+        if backend == POSIX_SPAWN and not hasattr(os, 'posix_spawnp'):
+            print("posix_spawn needs Python 3.8+, skipped")
+            continue
+        yield backend + ' shell', lambda backend=backend: capture_output(command, spawn=backend)
+        yield backend + ' list', lambda backend=backend: capture_output(cli, spawn=backend)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--runs", help="Número de ejecuciones por lanzador", default=200, type=int)
+    parser.add_argument("--ballast-mb", help="Memoria residente extra del proceso en MB", default=64, type=int)
+    parser.add_argument("--command", help="Comando ejecutado en cada prueba", default='true')
+    args = parser.parse_args()
+
+    ballast = bytearray(args.ballast_mb * 1024 * 1024)
+    for offset in range(0, len(ballast), 4096):
+        ballast[offset] = 1
+
+    print("command: %r, runs: %s, ballast: %s MB" % (args.command, args.runs, args.ballast_mb))
+    for name, run in launchers(args.command):
+        timings = measure(run, args.runs)
+        print("%-20s mean %.2fms  p50 %.2fms  p95 %.2fms  max %.2fms" % (
+            name + ':', 1000 * sum(timings) / len(timings), 1000 * percentile(timings, 50),
+            1000 * percentile(timings, 95), 1000 * max(timings)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*- pyversions=3.6+
+
+import time
+from collections import OrderedDict
+
+
+class TokenBucket(object):
+    def __init__(self, per_hour: float, burst: int):
+        self.rate = per_hour / 3600
+        self.capacity = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def consume(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+
+        return False
+
+
+class AlertLimiter(object):
+    """ Token buckets per alert phone and per error type. Alerts over the limits are
+    counted and summarized in a digest SMS every 'digest_interval' seconds """
+
+    def __init__(self, phone_per_hour: float = None, phone_burst: int = 5, type_per_hour: float = None,
+                 type_burst: int = 3, digest_interval: float = 600):
+        self.phone_per_hour = phone_per_hour
+        self.phone_burst = phone_burst
+        self.type_per_hour = type_per_hour
+        self.type_burst = type_burst
+        self.digest_interval = digest_interval
+        self._phone_buckets = {}
+        self._type_buckets = {}
+        # phone -> label -> [count, numbers]
+        self._suppressed = OrderedDict()
+        self._digest_at = time.monotonic() + digest_interval
+
+    @classmethod
+    def from_config(cls, conf):
+        return cls(phone_per_hour=conf.get('phone_per_hour'), phone_burst=conf.get('phone_burst', 5),
+                   type_per_hour=conf.get('type_per_hour'), type_burst=conf.get('type_burst', 3),
+                   digest_interval=conf.get('digest_interval', 600))
+
+    @staticmethod
+    def label(exception) -> str:
+        return getattr(exception, 'alert_label', type(exception).__name__)
+
+    def _allow(self, buckets, key, per_hour, burst) -> bool:
+        if per_hour is None:
+            return True
+
+        if key not in buckets:
+            buckets[key] = TokenBucket(per_hour=per_hour, burst=burst)
+
+        return buckets[key].consume()
+
+    def filter(self, exception, phones):
+        """ Returns the phones the alert can be sent to, the rest is kept for the digest """
+
+        label = self.label(exception)
+        type_allowed = self._allow(self._type_buckets, label, self.type_per_hour, self.type_burst)
+        allowed = []
+        for phone in phones:
+            if type_allowed and self._allow(self._phone_buckets, phone, self.phone_per_hour, self.phone_burst):
+                allowed.append(phone)
+            else:
+                suppressed = self._suppressed.setdefault(phone, OrderedDict()).setdefault(label, [0, set()])
+                suppressed[0] += 1
+                if exception.phone:
+                    suppressed[1].add(exception.phone)
+
+        return allowed
+
+    def digest(self, force: bool = False):
+        """ Returns (phone, message) for every phone with suppressed alerts once the interval is over """
+
+        now = time.monotonic()
+        if not force and now < self._digest_at:
+            return []
+
+        minutes = int(round(self.digest_interval / 60))
+        messages = []
+        for phone, labels in self._suppressed.items():
+            summary = ", ".join("%s %s from %s number%s" % (count, label, len(numbers), '' if len(numbers) == 1 else 's')
+                                if numbers else "%s %s" % (count, label)
+                                for label, (count, numbers) in labels.items())
+            messages.append((phone, "%s in last %s min" % (summary, minutes)))
+
+        self._suppressed.clear()
+        self._digest_at = now + self.digest_interval
+
+        return messages
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*- pyversions=3.6+
+
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+
+DEFAULT_MAX_BYTES = 1024 * 1024
+DEFAULT_BATCH_BYTES = 64 * 1024
+DEFAULT_FLUSH_INTERVAL = 5
+
+_CLOSE = object()
+
+
+class BatchedFileHandler(logging.Handler):
+    """ Log handler for slow storage, such as the SD card of the buoy. 'emit' only
+    queues the record: a background thread formats it and writes the file in batches
+    of 'batch_bytes', or every 'flush_interval' seconds, rotating it when it would
+    grow over 'max_bytes'. Records are dropped, and counted, when the queue is full,
+    so logging never blocks the daemon. Pending records are written when the handler
+    is closed, which 'logging.shutdown' does at exit """
+
+    terminator = '\n'
+
+    def __init__(self, filename: str, max_bytes: int = DEFAULT_MAX_BYTES, backup_count: int = 3,
+                 batch_bytes: int = DEFAULT_BATCH_BYTES, flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 queue_size: int = 10000, encoding: str = 'utf-8'):
+        super().__init__()
+        self.filename = os.path.abspath(filename)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.batch_bytes = batch_bytes
+        self.flush_interval = flush_interval
+        self.encoding = encoding
+        self.dropped = 0
+        self._queue = queue.Queue(queue_size)
+        self._stream = None
+        self._thread = threading.Thread(target=self._write_loop, name='log-writer', daemon=True)
+        self._thread.start()
+
+    def emit(self, record):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        """ Blocks until the records queued so far are written """
+
+        if self._thread.is_alive():
+            written = threading.Event()
+            self._queue.put(written)
+            written.wait()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(_CLOSE)
+            self._thread.join()
+        super().close()
+
+    def _write_loop(self):
+        batch = []
+        size = 0
+        deadline = None
+        while True:
+            try:
+                timeout = None if deadline is None else max(0, deadline - time.monotonic())
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, logging.LogRecord):
+                try:
+                    line = self.format(item) + self.terminator
+                except Exception:
+                    self.handleError(item)
+                    continue
+                batch.append(line)
+                size += len(line)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if size < self.batch_bytes:
+                    continue
+
+            self._write(batch, size)
+            batch, size, deadline = [], 0, None
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is _CLOSE:
+                self._close_stream()
+                return
+
+    def _write(self, batch, size):
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            line = "%s records dropped, log queue full%s" % (dropped, self.terminator)
+            batch.insert(0, line)
+            size += len(line)
+        if not batch:
+            return
+
+        try:
+            if self._stream is None:
+                self._stream = open(self.filename, 'a', encoding=self.encoding)
+            if self.max_bytes and self._stream.tell() and self._stream.tell() + size > self.max_bytes:
+                self._rotate()
+            self._stream.write(''.join(batch))
+            self._stream.flush()
+        except Exception:
+            self._close_stream()
+            if logging.raiseExceptions:
+                traceback.print_exc(file=sys.stderr)
+
+    def _rotate(self):
+        self._close_stream()
+        if self.backup_count > 0:
+            for index in range(self.backup_count - 1, 0, -1):
+                source = "%s.%d" % (self.filename, index)
+                if os.path.exists(source):
+                    os.replace(source, "%s.%d" % (self.filename, index + 1))
+            os.replace(self.filename, self.filename + ".1")
+        self._stream = open(self.filename, 'w', encoding=self.encoding)
+
+    def _close_stream(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
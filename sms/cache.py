@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*- pyversions=3.6+
+
+import time
+from collections import OrderedDict
+
+
+class ResultCache(object):
+    """ Last result of idempotent commands. Entries expire after their own ttl and
+    the least recently used ones are evicted beyond 'max_entries' """
+
+    def __init__(self, max_entries: int = 16):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """ Returns (result, age in seconds) or None """
+
+        self.evict()
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        self._entries.move_to_end(key)
+        result, stored_at, _ = entry
+
+        return result, time.monotonic() - stored_at
+
+    def put(self, key, result, ttl: float):
+        self._entries[key] = (result, time.monotonic(), ttl)
+        self._entries.move_to_end(key)
+        self.evict()
+
+    def evict(self):
+        now = time.monotonic()
+        for key in [key for key, (_, stored_at, ttl) in self._entries.items() if now - stored_at >= ttl]:
+            del self._entries[key]
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
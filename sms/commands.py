@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*- pyversions=3.6+
+
+from collections import namedtuple
+from string import Formatter
+from types import MappingProxyType
+
+from sms.process import DEFAULT_OUTPUT_LIMIT
+
+SMS_FIELDS = ('id', 'number', 'content', 'date', 'job_id')
+
+# Concurrency classes: exclusive commands never overlap anything, commands sharing
+# a mutex never overlap each other and parallel commands only wait for exclusive ones
+EXCLUSIVE = 'exclusive'
+MUTEX = 'mutex'
+PARALLEL = 'parallel'
+CONCURRENCY_CLASSES = (EXCLUSIVE, MUTEX, PARALLEL)
+
+CommandResult = namedtuple('CommandResult', ['output', 'output_bytes', 'truncated_bytes', 'cached'])
+# Age in seconds of a result reused from the cache, None when just executed
+CommandResult.__new__.__defaults__ = (None,)
+
+
+def cli_text(cli) -> str:
+    return " ".join(cli) if isinstance(cli, list) else cli
+
+
+def field_getter(name: str):
+    if name in SMS_FIELDS:
+        return lambda sms: sms.get(name)
+
+    if name.startswith('command_'):
+        attr = name[len('command_'):]
+        if attr in CommandResult._fields:
+            return lambda sms: getattr(sms.get('result'), attr, None)
+        if attr == 'cli':
+            return lambda sms: cli_text(sms['command'].cli)
+        if attr in ('key', 'timeout', 'output_limit', 'cache_ttl', 'builtin', 'background', 'priority'):
+            return lambda sms: getattr(sms['command'], attr)
+
+    raise ValueError("Unknown field {%s}" % name)
+
+
+class Template(object):
+    """ Reply message compiled once: only the fields it uses are resolved when rendered """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.fields = {}
+        for _, field, _, _ in Formatter().parse(text):
+            if field is not None:
+                name = field.split('.', 1)[0].split('[', 1)[0]
+                self.fields[name] = field_getter(name)
+
+    def render(self, sms) -> str:
+        return self.text.format(**{name: getter(sms) for name, getter in self.fields.items()})
+
+
+class Command(namedtuple('Command', ['key', 'cli', 'timeout', 'output_limit', 'cache_ttl', 'builtin',
+                                     'depends_on', 'background', 'priority', 'concurrency', 'mutex',
+                                     'templates'])):
+    """ Immutable command definition. Each message gets its own instance when the
+    command line is sent in the SMS. Builtin commands are run by the daemon itself
+    and receive the rest of the SMS as 'cli' """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_config(cls, key: str, conf: dict):
+        try:
+            templates = {name: Template(text) for name, text in conf['msg'].items()}
+        except ValueError as ex:
+            raise ValueError("Command %s: %s" % (key, ex))
+
+        concurrency = conf.get('concurrency', MUTEX)
+        if concurrency not in CONCURRENCY_CLASSES:
+            raise ValueError("Command %s: unknown concurrency class %s" % (key, concurrency))
+
+        return cls(key=key, cli=conf.get('cli'), timeout=conf.get('timeout'),
+                   output_limit=conf.get('output_limit', DEFAULT_OUTPUT_LIMIT), cache_ttl=conf.get('cache_ttl'),
+                   builtin=conf.get('builtin'), depends_on=tuple(conf.get('depends_on', ())),
+                   background=conf.get('background', False), priority=conf.get('priority', 0),
+                   concurrency=concurrency, mutex=conf.get('mutex', key), templates=MappingProxyType(templates))
+
+    def render(self, name: str, sms) -> str:
+        return self.templates[name].render(sms)
+
+
+class CommandRegistry(object):
+    def __init__(self, commands: dict):
+        self._commands = {key: Command.from_config(key, conf) for key, conf in commands.items()}
+        for command in self._commands.values():
+            for dependency in command.depends_on:
+                if dependency not in self._commands:
+                    raise ValueError("Command %s: depends on unknown command %s" % (command.key, dependency))
+        plan_batch(list(self._commands.values()))
+
+    def __contains__(self, key):
+        return key in self._commands
+
+    def __getitem__(self, key) -> Command:
+        return self._commands[key]
+
+    def __iter__(self):
+        return iter(self._commands)
+
+    def __len__(self):
+        return len(self._commands)
+
+
+def plan_batch(commands):
+    """ Groups the positions of the commands of a batch in waves: every command runs after
+    the commands of the batch it depends on, commands in the same wave are independent """
+
+    keys = {command.key for command in commands}
+    planned = set()
+    pending = list(range(len(commands)))
+    waves = []
+    while pending:
+        wave = [index for index in pending if all(dependency in planned or dependency not in keys
+                                                  for dependency in commands[index].depends_on)]
+        if not wave:
+            raise ValueError("Circular dependencies between commands %s" % ", ".join(sorted(
+                {commands[index].key for index in pending})))
+        waves.append(wave)
+        planned.update(commands[index].key for index in wave)
+        pending = [index for index in pending if index not in wave]
+
+    return waves
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*- pyversions=3.6+
+
+import asyncio
+import bisect
+import itertools
+import time
+
+from sms.commands import EXCLUSIVE, MUTEX
+
+
+class ExecutionSlot(object):
+    def __init__(self, scheduler, command):
+        self.scheduler = scheduler
+        self.command = command
+        self.waited = 0
+
+    async def __aenter__(self):
+        start = time.monotonic()
+        await self.scheduler.acquire(self.command)
+        self.waited = time.monotonic() - start
+        if self.scheduler.on_wait:
+            self.scheduler.on_wait(self.waited)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.scheduler.release(self.command)
+
+
+class CommandScheduler(object):
+    """ Grants execution slots to commands by priority, honoring their concurrency
+    class. An exclusive command that can't start holds back the commands of lower
+    priority, so it is never starved by a stream of parallel ones. Builtin commands
+    are run by the daemon itself and never wait """
+
+    def __init__(self, on_wait=None):
+        self.on_wait = on_wait
+        self._running = 0
+        self._exclusive = False
+        self._mutexes = set()
+        # (-priority, arrival, command, future) sorted by priority then arrival
+        self._waiting = []
+        self._arrivals = itertools.count()
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiting)
+
+    def slot(self, command) -> ExecutionSlot:
+        return ExecutionSlot(self, command)
+
+    def _can_run(self, command) -> bool:
+        if self._exclusive:
+            return False
+        if command.concurrency == EXCLUSIVE:
+            return self._running == 0
+        if command.concurrency == MUTEX:
+            return command.mutex not in self._mutexes
+
+        return True
+
+    def _grant(self, command):
+        self._running += 1
+        if command.concurrency == EXCLUSIVE:
+            self._exclusive = True
+        elif command.concurrency == MUTEX:
+            self._mutexes.add(command.mutex)
+
+    def _wake(self):
+        waiting = []
+        blocked = False
+        for entry in self._waiting:
+            command, future = entry[2], entry[3]
+            if future.done():
+                continue
+            if not blocked and self._can_run(command):
+                self._grant(command)
+                future.set_result(None)
+                continue
+
+            waiting.append(entry)
+            if command.concurrency == EXCLUSIVE:
+                blocked = True
+        self._waiting = waiting
+
+    async def acquire(self, command):
+        if command.builtin:
+            return
+
+        future = asyncio.get_event_loop().create_future()
+        bisect.insort(self._waiting, (-command.priority, next(self._arrivals), command, future))
+        self._wake()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(command)
+            else:
+                self._waiting = [entry for entry in self._waiting if entry[3] is not future]
+                self._wake()
+            raise
+
+    def release(self, command):
+        if command.builtin:
+            return
+
+        self._running -= 1
+        if command.concurrency == EXCLUSIVE:
+            self._exclusive = False
+        elif command.concurrency == MUTEX:
+            self._mutexes.discard(command.mutex)
+        self._wake()
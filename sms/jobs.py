@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*- pyversions=3.6+
+
+import threading
+import time
+from collections import OrderedDict
+
+from sms.process import kill_process_group
+
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+class Job(object):
+    def __init__(self, job_id: str, sms):
+        self.id = job_id
+        self.sms = sms
+        self.state = RUNNING
+        self.error = None
+        self.pid = None
+        self.started_at = time.monotonic()
+        self.finished_at = None
+
+    @property
+    def command(self):
+        return self.sms['command']
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def describe(self) -> str:
+        return "%s %s %s %.0fs" % (self.id, self.command.key, self.state, self.elapsed)
+
+
+class JobTable(object):
+    """ Background jobs: at most 'max_running' at once, the last 'max_finished'
+    finished jobs are kept for 'status' and evicted least recently used first """
+
+    def __init__(self, max_running: int = 4, max_finished: int = 16):
+        self.max_running = max_running
+        self.max_finished = max_finished
+        self._running = OrderedDict()
+        self._finished = OrderedDict()
+        self._unnotified = []
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+    @classmethod
+    def from_config(cls, conf):
+        return cls(max_running=conf.get('max_running', 4), max_finished=conf.get('max_finished', 16))
+
+    def __len__(self):
+        return len(self._running)
+
+    def start(self, sms):
+        """ Registers a job for the SMS, returns None when the table is full """
+
+        with self._lock:
+            if len(self._running) >= self.max_running:
+                return None
+
+            job = Job(str(self._next_id), sms)
+            self._next_id += 1
+            self._running[job.id] = job
+            sms['job_id'] = job.id
+
+            return job
+
+    def attach(self, job: Job, pid: int):
+        with self._lock:
+            job.pid = pid
+            cancelled = job.state == CANCELLED
+        if cancelled:
+            kill_process_group(pid)
+
+    def finish(self, job: Job, error=None):
+        with self._lock:
+            if job.state == RUNNING:
+                job.state = FAILED if error is not None else DONE
+                job.error = error
+            self._unnotified.append(job)
+            job.finished_at = time.monotonic()
+            self._running.pop(job.id, None)
+            self._finished[job.id] = job
+            while len(self._finished) > self.max_finished:
+                self._finished.popitem(last=False)
+            if not self._running:
+                self._idle.notify_all()
+
+    def wait_idle(self, timeout: float = None) -> bool:
+        """ Blocks until no job is running """
+
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._running, timeout)
+
+    def cancel(self, job_id: str):
+        """ Kills the process group of a running job, returns the job or None if it is not running """
+
+        with self._lock:
+            job = self._running.get(job_id)
+            if job is None or job.state != RUNNING:
+                return None
+            job.state = CANCELLED
+            pid = job.pid
+        if pid:
+            kill_process_group(pid)
+
+        return job
+
+    def cancel_all(self):
+        for job_id in list(self._running):
+            self.cancel(job_id)
+
+    def get(self, job_id: str):
+        with self._lock:
+            if job_id in self._finished:
+                self._finished.move_to_end(job_id)
+                return self._finished[job_id]
+
+            return self._running.get(job_id)
+
+    def jobs(self):
+        with self._lock:
+            return list(self._running.values()) + list(self._finished.values())[::-1]
+
+    def take_finished(self):
+        """ Returns the jobs finished, failed or cancelled since the last call """
+
+        with self._lock:
+            finished, self._unnotified = self._unnotified, []
+
+        return finished
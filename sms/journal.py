@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*- pyversions=3.6+
+
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+RECEIVED = 'R'
+STARTED = 'S'
+DONE = 'D'
+
+
+class SMSJournal(object):
+    """ Append-only journal of the SMS taken from the modem. Each line records a
+    state change of one message: received (with its content), started or done.
+    Received and done records are synced in batches, started records are synced
+    right away so that a command is never run twice after a crash """
+
+    def __init__(self, path: str, max_entries: int = 1000, sync_batch: int = 16):
+        self.path = path
+        self.max_entries = max_entries
+        self.sync_batch = sync_batch
+        self._entries = OrderedDict()
+        self._lines = 0
+        self._pending = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._load()
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    @classmethod
+    def from_config(cls, conf):
+        return cls(path=conf['path'], max_entries=conf.get('max_entries', 1000), sync_batch=conf.get('sync_batch', 16))
+
+    @staticmethod
+    def key(sms) -> str:
+        digest = hashlib.sha1("{number}\x00{content}\x00{date}".format(
+            number=sms['number'], content=sms['content'], date=sms.get('date')).encode('utf-8')).hexdigest()
+        return "%s:%s" % (sms['id'], digest[:12])
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                self._lines += 1
+                try:
+                    self._apply(json.loads(line))
+                except ValueError:
+                    # Last line may be torn by a crash in the middle of a write
+                    logger.warning("Ignoring corrupted journal line %s", self._lines)
+
+    def _apply(self, record):
+        key = record['k']
+        entry = self._entries.pop(key, None) or {}
+        entry['s'] = record['s']
+        for field in ('i', 'n', 'c', 'd'):
+            if field in record:
+                entry[field] = record[field]
+
+        if entry['s'] == DONE:
+            entry = {'s': DONE}
+        self._entries[key] = entry
+
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            if self._entries[oldest]['s'] != DONE:
+                break
+            del self._entries[oldest]
+
+    def _append(self, record, sync=False):
+        self._file.write(json.dumps(record, separators=(',', ':'), ensure_ascii=False) + '\n')
+        self._apply(record)
+        self._lines += 1
+        self._pending += 1
+        if sync or self._pending >= self.sync_batch:
+            self.sync()
+        if self._lines > 2 * self.max_entries:
+            self.compact()
+
+    def sync(self):
+        if self._pending:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._pending = 0
+
+    def seen(self, sms) -> bool:
+        return self.key(sms) in self._entries
+
+    def received(self, messages):
+        for sms in messages:
+            self._append({'k': self.key(sms), 's': RECEIVED, 'i': sms['id'], 'n': sms['number'],
+                          'c': sms['content'], 'd': sms.get('date')})
+        self.sync()
+
+    def started(self, sms):
+        self._append({'k': self.key(sms), 's': STARTED}, sync=True)
+
+    def done(self, sms):
+        self._append({'k': self.key(sms), 's': DONE})
+
+    def unfinished(self):
+        """ Returns (state, sms) of the messages received or started but not done """
+
+        return [(entry['s'], {'id': entry.get('i'), 'number': entry.get('n'), 'content': entry.get('c'),
+                              'date': entry.get('d')})
+                for entry in self._entries.values() if entry['s'] != DONE]
+
+    def compact(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for key, entry in self._entries.items():
+                f.write(json.dumps(dict(entry, k=key), separators=(',', ':'), ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._file.close()
+        os.replace(tmp_path, self.path)
+        dir_fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._lines = len(self._entries)
+        self._pending = 0
+
+    def close(self):
+        self.sync()
+        self._file.close()
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*- pyversions=3.6+
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(names, values, extra=None) -> str:
+    pairs = ['%s="%s"' % (name, escape(value)) for name, value in zip(names, values)]
+    if extra:
+        pairs.append('%s="%s"' % extra)
+
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter(object):
+    def __init__(self, name: str, documentation: str, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, value: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+    def get(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.documentation), '# TYPE %s counter' % self.name]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append('%s%s %s' % (self.name, format_labels(self.labels, labels), value))
+
+        return lines
+
+
+class Gauge(object):
+    def __init__(self, name: str, documentation: str, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def get(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.documentation), '# TYPE %s gauge' % self.name]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append('%s%s %s' % (self.name, format_labels(self.labels, labels), value))
+
+        return lines
+
+
+class Histogram(object):
+    def __init__(self, name: str, documentation: str, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket..., count, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def count(self, *labels) -> int:
+        counts = self._values.get(labels)
+        return counts[-2] if counts else 0
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.documentation), '# TYPE %s histogram' % self.name]
+        with self._lock:
+            for labels, counts in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    lines.append('%s_bucket%s %s' % (self.name, format_labels(self.labels, labels, ('le', bound)),
+                                                     count))
+                lines.append('%s_bucket%s %s' % (self.name, format_labels(self.labels, labels, ('le', '+Inf')),
+                                                 counts[-2]))
+                lines.append('%s_count%s %s' % (self.name, format_labels(self.labels, labels), counts[-2]))
+                lines.append('%s_sum%s %s' % (self.name, format_labels(self.labels, labels), counts[-1]))
+
+        return lines
+
+
+class Metrics(object):
+    """ Counters and latency histograms of the daemon, rendered in the Prometheus text format """
+
+    def __init__(self):
+        self.stage_duration = Histogram('sms_stage_duration_seconds', 'Duration of each stage of the SMS loop',
+                                        labels=('stage',))
+        self.command_duration = Histogram('sms_command_duration_seconds', 'Execution time of each command',
+                                          labels=('command',))
+        self.command_errors = Counter('sms_command_errors_total', 'Commands finished with error',
+                                      labels=('command',))
+        self.modem_errors = Counter('sms_modem_errors_total', 'Failed requests to the modem', labels=('operation',))
+        self.received = Counter('sms_received_total', 'SMS received')
+        self._metrics = [self.stage_duration, self.command_duration, self.command_errors, self.modem_errors,
+                         self.received]
+
+    def add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.stage_duration.observe(time.monotonic() - start, name)
+
+    @contextmanager
+    def modem(self, operation: str):
+        start = time.monotonic()
+        try:
+            yield
+        except Exception:
+            self.modem_errors.inc(operation)
+            raise
+        finally:
+            self.stage_duration.observe(time.monotonic() - start, operation)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        data = self.server.metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class MetricsExporter(object):
+    """ Publishes the metrics in an HTTP endpoint and/or a node-exporter textfile """
+
+    def __init__(self, metrics: Metrics, host: str = '127.0.0.1', port: int = None, textfile: str = None):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.textfile = textfile
+        self._server = None
+
+    @classmethod
+    def from_config(cls, metrics: Metrics, conf):
+        return cls(metrics, host=conf.get('host', '127.0.0.1'), port=conf.get('port'), textfile=conf.get('textfile'))
+
+    def start(self):
+        if self.port is None or self._server:
+            return
+
+        self._server = HTTPServer((self.host, self.port), MetricsRequestHandler)
+        self._server.metrics = self.metrics
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        logger.info("Metrics available on http://%s:%s/metrics", self.host, self._server.server_address[1])
+
+    def write_textfile(self):
+        if not self.textfile:
+            return
+
+        tmp_path = self.textfile + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(self.metrics.render())
+            os.replace(tmp_path, self.textfile)
+        except OSError as ex:
+            logger.warning("Can't write metrics to %s: %s", self.textfile, ex)
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        self.write_textfile()
@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*- pyversions=3.6+
+
+import logging
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from sms.outbound import GSM7, OutboundQueue
+
+logger = logging.getLogger(__name__)
+
+MODEM_URL = 'http://192.168.0.1'
+GET_CMD_PATH = '/goform/goform_get_cmd_process'
+SET_CMD_PATH = '/goform/goform_set_cmd_process'
+# Send latency assumed for a modem until its first SMS is sent
+DEFAULT_SEND_LATENCY = 1
+LATENCY_SMOOTHING = 0.2
+
+
+def encode_ucs2(text: str) -> str:
+    return text.encode('utf-16-be').hex().upper()
+
+
+def decode_ucs2(text: str) -> str:
+    try:
+        return bytes.fromhex(text).decode('utf-16-be')
+    except ValueError:
+        return text
+
+
+def sms_time() -> str:
+    offset = -(time.altzone if time.localtime().tm_isdst > 0 else time.timezone) // 3600
+    return time.strftime('%y;%m;%d;%H;%M;%S;') + '%+d' % offset
+
+
+class UnreadInbox(object):
+    """ Fetch the unread inbox only when the modem reports new messages, and reuse
+    the last result for 'ttl' seconds so that a poll cycle never fetches it twice """
+
+    def __init__(self, count, fetch, ttl: float = 1):
+        self.count = count
+        self.fetch = fetch
+        self.ttl = ttl
+        self._messages = None
+        self._fetched_at = 0
+
+    def unread(self):
+        now = time.monotonic()
+        if self._messages is not None and now - self._fetched_at < self.ttl:
+            return self._messages
+
+        try:
+            pending = self.count()
+        except Exception as ex:
+            logger.warning("Unread probe failed, fetching full inbox: %s", ex)
+            pending = True
+
+        self._messages = self.fetch() if pending else []
+        self._fetched_at = now
+
+        return self._messages
+
+    def discard(self, sms_id):
+        if self._messages:
+            self._messages = [sms for sms in self._messages if sms['id'] != sms_id]
+
+    def invalidate(self):
+        self._messages = None
+
+
+class ZTEModemClient(object):
+    """ Client for the HTTP API of the ZTE MF823 dongle. Keeps a persistent HTTP
+    session, deletes messages in batches and queues outgoing SMS until flushed """
+
+    def __init__(self, url: str = MODEM_URL, timeout: float = 5, cache_ttl: float = 1, outbound=None):
+        self.url = url
+        self.timeout = timeout
+        self.inbox = UnreadInbox(count=self.unread_count, fetch=self.fetch_unread, ttl=cache_ttl)
+        self.outbound = outbound if outbound is not None else OutboundQueue(send=self.send_sms)
+        self.send_latency = DEFAULT_SEND_LATENCY
+        self._session = None
+
+    @classmethod
+    def from_config(cls, conf):
+        client = cls(url=conf.get('url', MODEM_URL), timeout=conf.get('timeout', 5),
+                     cache_ttl=conf.get('cache_ttl', 1))
+        client.outbound = OutboundQueue.from_config(send=client.send_sms, conf=conf)
+
+        return client
+
+    @property
+    def session(self):
+        if self._session is None:
+            import requests
+
+            self._session = requests.Session()
+            self._session.headers.update({'Referer': self.url + '/index.html'})
+
+        return self._session
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def get_cmd(self, cmd: str, **params):
+        params.update({'isTest': 'false', 'cmd': cmd})
+        if ',' in cmd:
+            params['multi_data'] = 1
+
+        response = self.session.get(self.url + GET_CMD_PATH, params=params, timeout=self.timeout)
+        response.raise_for_status()
+
+        return response.json()
+
+    def set_cmd(self, goform_id: str, **data):
+        data.update({'isTest': 'false', 'goformId': goform_id, 'notCallback': 'true'})
+
+        response = self.session.post(self.url + SET_CMD_PATH, data=data, timeout=self.timeout)
+        response.raise_for_status()
+        result = response.json()
+        if result.get('result') != 'success':
+            raise IOError("Modem command %s failed: %s" % (goform_id, result))
+
+        return result
+
+    def unread_count(self) -> int:
+        status = self.get_cmd('sms_received_flag,sms_unread_num')
+
+        return int(status.get('sms_unread_num') or 0) or int(status.get('sms_received_flag') or 0)
+
+    def fetch_unread(self):
+        result = self.get_cmd('sms_data_total', page=0, data_per_page=500, mem_store=1, tags=1,
+                              order_by='order by id desc')
+
+        return [{'id': sms['id'], 'number': sms['number'], 'content': decode_ucs2(sms['content']),
+                 'date': sms.get('date')} for sms in result.get('messages', [])]
+
+    def sms_unread(self):
+        return self.inbox.unread()
+
+    def delete_sms(self, ids):
+        if not ids:
+            return
+
+        self.set_cmd('DELETE_SMS', msg_id=''.join('%s;' % sms_id for sms_id in ids))
+        for sms_id in ids:
+            self.inbox.discard(sms_id)
+
+    def queue_sms(self, phone: str, msg: str, key: str = None):
+        self.outbound.put(phone, msg, key)
+
+    def flush_sms(self, wait: bool = True) -> float:
+        return self.outbound.drain(wait=wait)
+
+    def clear_sms(self):
+        """ Drops the queued SMS, when they are kept elsewhere to be retried later """
+
+        self.outbound.take()
+
+    def set_on_sent(self, on_sent):
+        self.outbound.on_sent = on_sent
+
+    def send_sms(self, phones, message):
+        # The modem builds the concatenated parts from the whole body
+        encode_type = 'GSM7_default' if message.encoding == GSM7 else 'UNICODE'
+        start = time.monotonic()
+        self.set_cmd('SEND_SMS', Number=';'.join(phones), sms_time=sms_time(), MessageBody=encode_ucs2(message.text),
+                     ID=-1, encode_type=encode_type)
+        self.send_latency += LATENCY_SMOOTHING * (time.monotonic() - start - self.send_latency)
+
+
+class ModemPool(object):
+    """ Several modems used as one. Inboxes are polled concurrently and merged: a copy
+    of an SMS already read from another modem within 'dedup_window' seconds is deleted
+    unread. Outgoing SMS are queued in the healthy modem with the lowest expected
+    latency, and moved to another one when a send fails. A failed modem is left out
+    for 'retry_interval' seconds """
+
+    ID_SEPARATOR = '/'
+
+    def __init__(self, modems, names=None, dedup_window: float = 300, retry_interval: float = 60):
+        self.modems = list(modems)
+        self.names = list(names or [str(index) for index in range(len(self.modems))])
+        self.dedup_window = dedup_window
+        self.retry_interval = retry_interval
+        self._down_until = [0] * len(self.modems)
+        # (number, content) -> (modem name, read at)
+        self._seen = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=len(self.modems))
+
+    @classmethod
+    def from_config(cls, modems, conf):
+        return cls([ZTEModemClient.from_config(modem) for modem in modems],
+                   names=[modem.get('name', str(index)) for index, modem in enumerate(modems)],
+                   dedup_window=conf.get('dedup_window', 300), retry_interval=conf.get('retry_interval', 60))
+
+    def available(self):
+        now = time.monotonic()
+        healthy = [index for index, down_until in enumerate(self._down_until) if now >= down_until]
+
+        return healthy or list(range(len(self.modems)))
+
+    def mark_down(self, index: int, ex):
+        logger.warning("Modem %s failed, leaving it out for %ss: %s", self.names[index], self.retry_interval, ex)
+        self._down_until[index] = time.monotonic() + self.retry_interval
+
+    def mark_up(self, index: int):
+        self._down_until[index] = 0
+
+    def pick(self, candidates):
+        return min(candidates, key=lambda index: self.modems[index].send_latency *
+                   (len(self.modems[index].outbound) + 1))
+
+    def sms_unread(self):
+        polled = self.available()
+        futures = [(index, self._executor.submit(self.modems[index].sms_unread)) for index in polled]
+        messages = []
+        errors = []
+        for index, future in futures:
+            try:
+                inbox = future.result()
+            except Exception as ex:
+                self.mark_down(index, ex)
+                errors.append(ex)
+                continue
+
+            self.mark_up(index)
+            messages += [dict(sms, id=self.names[index] + self.ID_SEPARATOR + str(sms['id']), modem=self.names[index])
+                         for sms in inbox]
+
+        if len(errors) == len(polled):
+            raise errors[0]
+
+        return self.dedup(messages)
+
+    def dedup(self, messages):
+        now = time.monotonic()
+        while self._seen and now - next(iter(self._seen.values()))[1] > self.dedup_window:
+            self._seen.popitem(last=False)
+
+        unique = []
+        duplicates = []
+        for sms in messages:
+            key = (sms['number'], sms['content'])
+            seen = self._seen.get(key)
+            if seen is not None and seen[0] != sms['modem']:
+                duplicates.append(sms['id'])
+                continue
+
+            self._seen.pop(key, None)
+            self._seen[key] = (sms['modem'], now)
+            unique.append(sms)
+
+        if duplicates:
+            logger.info("Deleting %s copies already read from another modem", len(duplicates))
+            try:
+                self.delete_sms(duplicates)
+            except Exception as ex:
+                logger.warning("Can't delete copies %s: %s", duplicates, ex)
+
+        return unique
+
+    def delete_sms(self, ids):
+        by_modem = OrderedDict()
+        for sms_id in ids:
+            name, _, local_id = sms_id.partition(self.ID_SEPARATOR)
+            by_modem.setdefault(self.names.index(name), []).append(local_id)
+
+        error = None
+        for index, local_ids in by_modem.items():
+            try:
+                self.modems[index].delete_sms(local_ids)
+            except Exception as ex:
+                self.mark_down(index, ex)
+                error = ex
+        if error is not None:
+            raise error
+
+    def queue_sms(self, phone: str, msg: str, key: str = None):
+        self.modems[self.pick(self.available())].queue_sms(phone, msg, key)
+
+    def failover(self, index: int):
+        """ Moves the SMS queued in a failed modem to the other healthy ones, returns their indexes """
+
+        now = time.monotonic()
+        others = [other for other, down_until in enumerate(self._down_until) if other != index and now >= down_until]
+        if not others:
+            return []
+
+        targets = []
+        for message, phones, keys in self.modems[index].outbound.take():
+            for phone, key in zip(phones, keys):
+                target = self.pick(others)
+                self.modems[target].queue_sms(phone, message.text, key)
+                if target not in targets:
+                    targets.append(target)
+        logger.warning("Moved SMS queued in modem %s to %s", self.names[index],
+                       ", ".join(self.names[target] for target in targets))
+
+        return targets
+
+    def flush_sms(self, wait: bool = True) -> float:
+        delay = 0
+        pending = [index for index, modem in enumerate(self.modems) if len(modem.outbound)]
+        while pending:
+            index = pending.pop(0)
+            try:
+                modem_delay = self.modems[index].flush_sms(wait)
+            except Exception as ex:
+                self.mark_down(index, ex)
+                targets = self.failover(index)
+                if not targets:
+                    raise
+                pending += [target for target in targets if target not in pending]
+                continue
+
+            self.mark_up(index)
+            if modem_delay:
+                delay = min(delay, modem_delay) if delay else modem_delay
+
+        return delay
+
+    def clear_sms(self):
+        for modem in self.modems:
+            modem.clear_sms()
+
+    def set_on_sent(self, on_sent):
+        for modem in self.modems:
+            modem.set_on_sent(on_sent)
+
+    def close(self):
+        for modem in self.modems:
+            modem.close()
+        self._executor.shutdown(wait=False)
+
+
+def modem_from_config(config):
+    """ Modem pool from the 'modems' list, or a single client from the legacy 'modem' section """
+
+    if 'modems' in config:
+        return ModemPool.from_config(config['modems'], config.get('modem_pool', {}))
+
+    return ZTEModemClient.from_config(config.get('modem', {}))
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*- pyversions=3.6+
+
+import time
+from collections import deque, namedtuple
+
+GSM7 = 'GSM7'
+UCS2 = 'UCS2'
+
+GSM7_BASIC = set("@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+                 "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà")
+GSM7_EXTENDED = set("\f^{}\\[~]|€")
+
+# Capacity of a single SMS and of each part of a concatenated SMS
+SEGMENT_SIZE = {GSM7: (160, 153), UCS2: (70, 67)}
+
+TRUNCATE_MARKER = '...'
+
+OutboundMessage = namedtuple('OutboundMessage', ['text', 'encoding', 'segments'])
+
+
+def encoding(text: str) -> str:
+    return GSM7 if all(c in GSM7_BASIC or c in GSM7_EXTENDED for c in text) else UCS2
+
+
+def char_size(c: str, enc: str) -> int:
+    if enc == GSM7:
+        return 2 if c in GSM7_EXTENDED else 1
+
+    return 2 if ord(c) > 0xFFFF else 1
+
+
+def split_segments(text: str):
+    enc = encoding(text)
+    single, multi = SEGMENT_SIZE[enc]
+    sizes = [char_size(c, enc) for c in text]
+    if sum(sizes) <= single:
+        return [text]
+
+    segments, start, used = [], 0, 0
+    for index, size in enumerate(sizes):
+        if used + size > multi:
+            segments.append(text[start:index])
+            start, used = index, 0
+        used += size
+    segments.append(text[start:])
+
+    return segments
+
+
+def fit(text: str, max_segments: int, truncate: str = 'head') -> str:
+    """ Truncate text to 'max_segments' parts. 'head' keeps the beginning of the
+    text and 'tail' keeps the end, the removed part is replaced by a marker """
+
+    if len(split_segments(text)) <= max_segments:
+        return text
+
+    enc = encoding(text)
+    single, multi = SEGMENT_SIZE[enc]
+    budget = (single if max_segments == 1 else multi * max_segments) - len(TRUNCATE_MARKER)
+    chars = text if truncate == 'head' else reversed(text)
+
+    length, used = 0, 0
+    for c in chars:
+        used += char_size(c, enc)
+        if used > budget:
+            break
+        length += 1
+
+    while True:
+        if truncate == 'head':
+            fitted = text[:length] + TRUNCATE_MARKER
+        else:
+            fitted = TRUNCATE_MARKER + text[len(text) - length:]
+        if len(split_segments(fitted)) <= max_segments:
+            return fitted
+        length -= 1
+
+
+def build_message(text: str, max_segments: int, truncate: str = 'head') -> OutboundMessage:
+    text = fit(text, max_segments, truncate)
+
+    return OutboundMessage(text=text, encoding=encoding(text), segments=len(split_segments(text)))
+
+
+class OutboundQueue(object):
+    """ Outgoing SMS waiting to be sent. Messages are truncated to 'max_segments'
+    when queued and drained at no more than 'segments_per_minute'. Each phone may
+    carry a key, 'on_sent' is called with the keys of every message sent """
+
+    def __init__(self, send, max_segments: int = 4, truncate: str = 'head', segments_per_minute: float = 0,
+                 on_sent=None):
+        if truncate not in ('head', 'tail'):
+            raise ValueError("Unknown truncate policy %s" % truncate)
+
+        self.send = send
+        self.max_segments = max_segments
+        self.truncate = truncate
+        self.segments_per_minute = segments_per_minute
+        self.on_sent = on_sent
+        self._queue = deque()
+        self._next_send = 0
+
+    @classmethod
+    def from_config(cls, send, conf):
+        return cls(send=send, max_segments=conf.get('max_segments', 4), truncate=conf.get('truncate', 'head'),
+                   segments_per_minute=conf.get('segments_per_minute', 0))
+
+    def __len__(self):
+        return len(self._queue)
+
+    def put(self, phone: str, text: str, key: str = None):
+        message = build_message(text, self.max_segments, self.truncate)
+        # Consecutive copies of the same body to different numbers are sent at once
+        if self._queue and self._queue[-1][0] == message and phone not in self._queue[-1][1]:
+            self._queue[-1][1].append(phone)
+            self._queue[-1][2].append(key)
+        else:
+            self._queue.append((message, [phone], [key]))
+
+    def take(self):
+        """ Removes and returns the queued (message, phones, keys), to send them through another modem """
+
+        pending = list(self._queue)
+        self._queue.clear()
+
+        return pending
+
+    def drain(self, wait: bool = True) -> float:
+        """ Send queued messages. Without 'wait' it stops when the rate limit is
+        reached and returns the seconds until the next message can be sent """
+
+        while self._queue:
+            delay = self._next_send - time.monotonic()
+            if delay > 0:
+                if not wait:
+                    return delay
+                time.sleep(delay)
+
+            message, phones, keys = self._queue[0]
+            self.send(phones, message)
+            self._queue.popleft()
+            if self.on_sent:
+                self.on_sent([key for key in keys if key is not None])
+            if self.segments_per_minute:
+                self._next_send = time.monotonic() + message.segments * 60 / self.segments_per_minute
+
+        return 0
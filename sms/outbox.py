@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*- pyversions=3.6+
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    key TEXT PRIMARY KEY,
+    phone TEXT NOT NULL,
+    text TEXT NOT NULL,
+    created REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0
+)
+"""
+
+
+class Outbox(object):
+    """ Outgoing SMS kept in SQLite until the modem sends them. A pending SMS with
+    the same phone and text as a new one absorbs it. When the modem fails, the SMS
+    handed to it wait 'base_delay' seconds, doubled on every failure up to
+    'max_delay', and a successful send releases all of them at once. Inserts and
+    deletes are committed together by 'commit' """
+
+    def __init__(self, path: str, base_delay: float = 30, max_delay: float = 3600, batch: int = 16):
+        self.path = path
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.batch = batch
+        # Keys handed to the modem and not sent yet
+        self._queued = set()
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(SCHEMA)
+        self._db.commit()
+        self._backoff = self._db.execute("SELECT 1 FROM outbox WHERE attempts > 0 LIMIT 1").fetchone() is not None
+
+    @classmethod
+    def from_config(cls, conf):
+        return cls(path=conf['path'], base_delay=conf.get('base_delay', 30), max_delay=conf.get('max_delay', 3600),
+                   batch=conf.get('batch', 16))
+
+    @staticmethod
+    def key(phone: str, text: str) -> str:
+        return hashlib.sha1("{}\x00{}".format(phone, text).encode('utf-8')).hexdigest()[:16]
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def put(self, phone: str, text: str):
+        """ Adds an SMS, returns its key or None when the same SMS is already pending """
+
+        key = self.key(phone, text)
+        with self._lock:
+            cursor = self._db.execute("INSERT OR IGNORE INTO outbox (key, phone, text, created) VALUES (?, ?, ?, ?)",
+                                      (key, phone, text, time.time()))
+
+        return key if cursor.rowcount else None
+
+    def due(self):
+        """ Returns up to 'batch' (key, phone, text) not handed to the modem and not waiting a retry,
+        oldest first. They are considered handed to the modem until 'sent' or 'failed' """
+
+        with self._lock:
+            rows = self._db.execute("SELECT key, phone, text FROM outbox WHERE next_attempt <= ? ORDER BY created",
+                                    (time.time(),)).fetchall()
+            rows = [row for row in rows if row[0] not in self._queued][:self.batch]
+            self._queued.update(row[0] for row in rows)
+
+        return rows
+
+    def sent(self, keys):
+        with self._lock:
+            self._db.executemany("DELETE FROM outbox WHERE key = ?", [(key,) for key in keys])
+            self._queued.difference_update(keys)
+            if keys and self._backoff:
+                self._db.execute("UPDATE outbox SET next_attempt = 0")
+                self._backoff = False
+
+    def failed(self):
+        """ Delays the SMS handed to the modem and not sent, returns the seconds until the next retry """
+
+        with self._lock:
+            now = time.time()
+            for key in self._queued:
+                attempts = self._db.execute("SELECT attempts FROM outbox WHERE key = ?", (key,)).fetchone()
+                if attempts is None:
+                    continue
+                delay = min(self.max_delay, self.base_delay * 2 ** attempts[0])
+                self._db.execute("UPDATE outbox SET attempts = attempts + 1, next_attempt = ? WHERE key = ?",
+                                 (now + delay, key))
+            self._queued.clear()
+            self._backoff = True
+
+        return self.retry_in()
+
+    def retry_in(self) -> float:
+        """ Seconds until the first SMS waiting a retry can be sent, 0 if none is waiting """
+
+        with self._lock:
+            next_attempt = self._db.execute("SELECT MIN(next_attempt) FROM outbox WHERE next_attempt > 0"
+                                            ).fetchone()[0]
+
+        return max(0, next_attempt - time.time()) if next_attempt else 0
+
+    def describe(self) -> str:
+        with self._lock:
+            pending, oldest, attempts = self._db.execute(
+                "SELECT COUNT(*), MIN(created), MAX(attempts) FROM outbox").fetchone()
+        if not pending:
+            return "Outbox empty"
+
+        summary = "Outbox: %s pending, oldest %.0fs" % (pending, time.time() - oldest)
+        if attempts:
+            summary += ", %s failed attempts, retry in %.0fs" % (attempts, self.retry_in())
+
+        return summary
+
+    def commit(self):
+        with self._lock:
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.commit()
+            self._db.close()
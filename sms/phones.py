@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*- pyversions=3.6+
+
+import re
+
+INTERNATIONAL_PREFIX = '00'
+SEPARATORS = re.compile(r'[\s.()-]')
+
+
+class AllCommands(object):
+    """ Permissions of a phone allowed to run every command """
+
+    def __contains__(self, key):
+        return True
+
+    def __repr__(self):
+        return 'AllCommands()'
+
+
+ALL_COMMANDS = AllCommands()
+
+
+class PhoneNumbering(object):
+    """ Normalizes phone numbers to E.164, so that '0034666666666', '+34 666 666 666'
+    and the national '666666666' are the same number. Numbers of up to
+    'short_code_digits' digits are short codes, such as 5087, and are kept as they
+    are. National numbers have 'national_digits' digits and get 'country_code' """
+
+    def __init__(self, country_code: str = None, national_digits: int = None, short_code_digits: int = 6):
+        self.country_code = str(country_code).lstrip('+') if country_code else None
+        self.national_digits = national_digits
+        self.short_code_digits = short_code_digits
+
+    @classmethod
+    def from_config(cls, conf):
+        return cls(country_code=conf.get('country_code'), national_digits=conf.get('national_digits'),
+                   short_code_digits=conf.get('short_code_digits', 6))
+
+    def normalize(self, number) -> str:
+        number = SEPARATORS.sub('', str(number))
+        if number.startswith('+'):
+            return number
+        if not number.isdigit():
+            # Alphanumeric senders, such as the carrier
+            return number
+        if number.startswith(INTERNATIONAL_PREFIX):
+            return '+' + number[len(INTERNATIONAL_PREFIX):]
+        if len(number) <= self.short_code_digits:
+            return number
+        if self.country_code and self.national_digits:
+            if len(number) == self.national_digits:
+                return '+' + self.country_code + number
+            if len(number) == len(self.country_code) + self.national_digits and number.startswith(self.country_code):
+                return '+' + number
+
+        return number
+
+
+class PhoneAccess(object):
+    """ Authorized phones, normalized once, and the commands each one may run. Phones
+    in 'authorized' run every command, the phones of a group run the commands of the
+    group, or every command if they are '*', and a phone in several groups gets all
+    of their commands. Checking a message costs a single dict lookup """
+
+    def __init__(self, authorized=(), groups=None, numbering: PhoneNumbering = None):
+        self.numbering = numbering or PhoneNumbering()
+        self._allowed = {}
+        for phone in authorized:
+            self._allowed[self.numbering.normalize(phone)] = ALL_COMMANDS
+
+        for name, group in (groups or {}).items():
+            commands = group.get('commands')
+            if not commands:
+                raise ValueError("Phone group %s: no commands" % name)
+            allowed = ALL_COMMANDS if commands == '*' else frozenset(commands)
+            for phone in group.get('phones', ()):
+                phone = self.numbering.normalize(phone)
+                current = self._allowed.get(phone)
+                if current is ALL_COMMANDS or allowed is ALL_COMMANDS:
+                    self._allowed[phone] = ALL_COMMANDS
+                else:
+                    self._allowed[phone] = allowed | (current or frozenset())
+
+    @classmethod
+    def from_config(cls, conf):
+        return cls(authorized=conf.get('authorized', ()), groups=conf.get('groups'),
+                   numbering=PhoneNumbering.from_config(conf))
+
+    @property
+    def phones(self):
+        return self._allowed.keys()
+
+    def commands(self):
+        """ Returns the command keys named by the groups """
+
+        keys = set()
+        for allowed in self._allowed.values():
+            if allowed is not ALL_COMMANDS:
+                keys.update(allowed)
+
+        return keys
+
+    def allowed(self, number):
+        """ Returns the commands the number may run, or None if it is not authorized """
+
+        return self._allowed.get(self.numbering.normalize(number))
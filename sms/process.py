@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*- pyversions=3.6+
+
+import asyncio
+import logging
+import os
+import signal
+from subprocess import PIPE, STDOUT, Popen, CalledProcessError, TimeoutExpired
+from threading import Event, Timer
+
+DEFAULT_OUTPUT_LIMIT = 4096
+CHUNK_SIZE = 4096
+TRUNCATE_MARKER = b'...'
+SUBPROCESS = 'subprocess'
+POSIX_SPAWN = 'posix_spawn'
+SPAWN_BACKENDS = (SUBPROCESS, POSIX_SPAWN)
+
+logger = logging.getLogger(__name__)
+
+
+class OutputBuffer(object):
+    """ Keeps the first and the last bytes of a command output within 'limit'
+    bytes, counting everything that was written """
+
+    def __init__(self, limit: int = DEFAULT_OUTPUT_LIMIT):
+        self.head_limit = limit // 2
+        self.tail_limit = limit - self.head_limit
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+
+    @classmethod
+    def from_bytes(cls, data: bytes, limit: int = DEFAULT_OUTPUT_LIMIT):
+        buffer = cls(limit=limit)
+        buffer.write(data)
+        return buffer
+
+    @property
+    def truncated(self) -> int:
+        return self.total - len(self.head) - len(self.tail)
+
+    def write(self, data: bytes):
+        self.total += len(data)
+        free = self.head_limit - len(self.head)
+        if free > 0:
+            self.head += data[:free]
+            data = data[free:]
+
+        self.tail += data
+        if len(self.tail) > self.tail_limit:
+            del self.tail[:len(self.tail) - self.tail_limit]
+
+    def getvalue(self) -> bytes:
+        if self.truncated:
+            return bytes(self.head) + TRUNCATE_MARKER + bytes(self.tail)
+
+        return bytes(self.head + self.tail)
+
+
+def resolve_spawn_backend(name: str) -> str:
+    if name not in SPAWN_BACKENDS:
+        raise ValueError("Unknown spawn backend %s" % name)
+
+    if name == POSIX_SPAWN and not hasattr(os, 'posix_spawnp'):
+        logger.warning("posix_spawn needs Python 3.8+, spawning with subprocess")
+        return SUBPROCESS
+
+    return name
+
+
+class SpawnedProcess(object):
+    """ Process started with posix_spawn, without copying the page tables of the
+    daemon as fork does. Offers the pid, stdout, wait and returncode of Popen """
+
+    def __init__(self, cmd):
+        argv = cmd if isinstance(cmd, list) else ['/bin/sh', '-c', cmd]
+        read_fd, write_fd = os.pipe()
+        try:
+            self.pid = os.posix_spawnp(argv[0], argv, os.environ, setsid=True,
+                                       file_actions=[(os.POSIX_SPAWN_DUP2, write_fd, 1),
+                                                     (os.POSIX_SPAWN_DUP2, write_fd, 2)])
+        except BaseException:
+            os.close(read_fd)
+            raise
+        finally:
+            os.close(write_fd)
+
+        self.stdout = os.fdopen(read_fd, 'rb', 0)
+        self.returncode = None
+
+    def wait(self) -> int:
+        if self.returncode is None:
+            _, status = os.waitpid(self.pid, 0)
+            self.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+
+        return self.returncode
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stdout.close()
+        self.wait()
+
+
+class AsyncSpawnedProcess(object):
+    """ SpawnedProcess read from the event loop, with the interface of asyncio.subprocess.Process """
+
+    def __init__(self, process: SpawnedProcess, stdout: asyncio.StreamReader, transport):
+        self.process = process
+        self.pid = process.pid
+        self.stdout = stdout
+        self.transport = transport
+        self._waiter = None
+
+    @classmethod
+    async def spawn(cls, cmd):
+        loop = asyncio.get_event_loop()
+        process = SpawnedProcess(cmd)
+        stdout = asyncio.StreamReader()
+        transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(stdout), process.stdout)
+
+        return cls(process, stdout, transport)
+
+    @property
+    def returncode(self):
+        return self.process.returncode
+
+    async def wait(self) -> int:
+        # A single blocking waitpid per process, shared by every caller
+        if self._waiter is None:
+            self._waiter = asyncio.get_event_loop().run_in_executor(None, self.process.wait)
+            self._waiter.add_done_callback(lambda _: self.transport.close())
+
+        return await asyncio.shield(self._waiter)
+
+
+def kill_process_group(pid):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def spawn_process(cmd, spawn: str = SUBPROCESS):
+    if spawn == POSIX_SPAWN:
+        return SpawnedProcess(cmd)
+
+    return Popen(cmd, stdout=PIPE, stderr=STDOUT, shell=not isinstance(cmd, list), start_new_session=True)
+
+
+async def spawn_process_async(cmd, spawn: str = SUBPROCESS):
+    if spawn == POSIX_SPAWN:
+        return await AsyncSpawnedProcess.spawn(cmd)
+
+    if isinstance(cmd, list):
+        return await asyncio.create_subprocess_exec(*cmd, stdout=PIPE, stderr=STDOUT, start_new_session=True)
+
+    return await asyncio.create_subprocess_shell(cmd, stdout=PIPE, stderr=STDOUT, start_new_session=True)
+
+
+def capture_output(cmd, timeout=None, limit: int = DEFAULT_OUTPUT_LIMIT, on_start=None,
+                   spawn: str = SUBPROCESS) -> OutputBuffer:
+    output = OutputBuffer(limit=limit)
+    expired = Event()
+    with spawn_process(cmd, spawn) as proc:
+        if on_start:
+            on_start(proc.pid)
+
+        def expire():
+            expired.set()
+            kill_process_group(proc.pid)
+
+        timer = Timer(timeout, expire) if timeout else None
+        if timer:
+            timer.start()
+        try:
+            for chunk in iter(lambda: os.read(proc.stdout.fileno(), CHUNK_SIZE), b''):
+                output.write(chunk)
+            proc.wait()
+        finally:
+            if timer:
+                timer.cancel()
+
+    if expired.is_set():
+        raise TimeoutExpired(cmd, timeout, output=output.getvalue())
+
+    if proc.returncode:
+        raise CalledProcessError(proc.returncode, cmd, output=output.getvalue())
+
+    return output
+
+
+async def capture_output_async(cmd, timeout=None, limit: int = DEFAULT_OUTPUT_LIMIT, on_start=None,
+                               spawn: str = SUBPROCESS) -> OutputBuffer:
+    proc = await spawn_process_async(cmd, spawn)
+    if on_start:
+        on_start(proc.pid)
+
+    output = OutputBuffer(limit=limit)
+
+    async def read():
+        while True:
+            chunk = await proc.stdout.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            output.write(chunk)
+        await proc.wait()
+
+    try:
+        await asyncio.wait_for(read(), timeout)
+    except asyncio.TimeoutError:
+        kill_process_group(proc.pid)
+        await proc.wait()
+        raise TimeoutExpired(cmd, timeout, output=output.getvalue())
+    except asyncio.CancelledError:
+        kill_process_group(proc.pid)
+        raise
+
+    if proc.returncode:
+        raise CalledProcessError(proc.returncode, cmd, output=output.getvalue())
+
+    return output
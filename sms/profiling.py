@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*- pyversions=3.6+
+
+import cProfile
+import logging
+import os
+import pstats
+import signal
+import time
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+
+class Profiler(object):
+    """ cProfile and tracemalloc runs started and stopped on demand. Every run is
+    dumped to 'path' and the oldest dumps are removed beyond 'max_bytes' """
+
+    def __init__(self, path: str, prefix: str = 'sms-cmd', max_bytes: int = 10 * 1024 * 1024, top: int = 5):
+        self.path = path
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.top = top
+        self._profile = None
+        self._last_cpu = None
+        self._last_memory = None
+
+    @classmethod
+    def from_config(cls, conf, prefix: str = 'sms-cmd'):
+        return cls(path=conf['path'], prefix=prefix, max_bytes=conf.get('max_bytes', 10 * 1024 * 1024),
+                   top=conf.get('top', 5))
+
+    def install_signals(self):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: self.toggle_cpu())
+        signal.signal(signal.SIGUSR2, lambda signum, frame: self.toggle_memory())
+
+    @property
+    def cpu_running(self) -> bool:
+        return self._profile is not None
+
+    @property
+    def memory_running(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def dump_path(self, kind: str, extension: str) -> str:
+        os.makedirs(self.path, exist_ok=True)
+        return os.path.join(self.path, "%s-%s-%s.%s" % (self.prefix, kind, time.strftime('%Y%m%dT%H%M%S'), extension))
+
+    def toggle_cpu(self) -> str:
+        if self._profile is None:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+            logger.info("CPU profiling started")
+            return "CPU profiling started"
+
+        self._profile.disable()
+        dump = self.dump_path('cpu', 'prof')
+        self._profile.dump_stats(dump)
+        self._last_cpu = pstats.Stats(self._profile)
+        self._profile = None
+        self.enforce_cap()
+        logger.info("CPU profiling stopped, dumped to %s", dump)
+        return self.top_cpu()
+
+    def toggle_memory(self) -> str:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            logger.info("Memory tracing started")
+            return "Memory tracing started"
+
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        dump = self.dump_path('mem', 'snapshot')
+        snapshot.dump(dump)
+        self._last_memory = snapshot
+        self.enforce_cap()
+        logger.info("Memory tracing stopped, dumped to %s", dump)
+        return self.top_memory()
+
+    def top_cpu(self, top: int = None) -> str:
+        if self._last_cpu is None:
+            return "No CPU profile"
+
+        rows = sorted(self._last_cpu.stats.items(), key=lambda item: item[1][2], reverse=True)[:top or self.top]
+        return "\n".join("%s:%s %s %.3fs" % (os.path.basename(filename), line, func, tottime)
+                         for (filename, line, func), (_, _, tottime, _, _) in rows)
+
+    def top_memory(self, top: int = None) -> str:
+        if self._last_memory is None:
+            return "No memory snapshot"
+
+        stats = self._last_memory.statistics('lineno')[:top or self.top]
+        return "\n".join("%s:%s %.1fKiB" % (os.path.basename(stat.traceback[0].filename), stat.traceback[0].lineno,
+                                             stat.size / 1024) for stat in stats)
+
+    def enforce_cap(self):
+        dumps = [os.path.join(self.path, name) for name in os.listdir(self.path) if name.startswith(self.prefix + '-')]
+        dumps.sort(key=os.path.getmtime)
+        total = sum(os.path.getsize(dump) for dump in dumps)
+        while dumps and total > self.max_bytes:
+            oldest = dumps.pop(0)
+            total -= os.path.getsize(oldest)
+            os.remove(oldest)
+
+    def command(self, args: str) -> str:
+        """ SMS command: 'cpu' or 'mem' start or stop a run, without arguments returns the last results """
+
+        args = args.strip()
+        if args == 'cpu':
+            return self.toggle_cpu()
+        if args == 'mem':
+            return self.toggle_memory()
+
+        return "CPU:\n%s\nMEM:\n%s" % (self.top_cpu(), self.top_memory())
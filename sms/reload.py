@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*- pyversions=3.6+
+
+import logging
+import os
+import signal
+import threading
+
+import buoy.lib.utils.config as load_config
+
+logger = logging.getLogger(__name__)
+
+
+class ConfigReloader(object):
+    """ Loads and compiles the configuration file in a background thread on SIGHUP,
+    or when its modification time changes if 'watch' is set. The daemon takes the
+    result with 'take' between loop iterations, so a swap never happens while a
+    message is being checked """
+
+    def __init__(self, path: str, compile, watch: bool = False, load=None):
+        self.path = path
+        self.compile = compile
+        self.watch = watch
+        self.load = load or (lambda path: load_config.load_config(path_config=path))
+        self._ready = None
+        self._requested = False
+        self._thread = None
+        self._lock = threading.Lock()
+        self._mtime = self._stat()
+
+    def _stat(self):
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    def install_signals(self):
+        signal.signal(signal.SIGHUP, lambda signum, frame: self.request())
+
+    def request(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                self._requested = True
+                return
+
+            self._thread = threading.Thread(target=self._reload, daemon=True)
+            self._thread.start()
+
+    def _reload(self):
+        while True:
+            logger.info("Reloading config from %s", self.path)
+            self._mtime = self._stat()
+            try:
+                ready = (self.compile(self.load(self.path)), None)
+            except Exception as ex:
+                ready = (None, ex)
+
+            with self._lock:
+                self._ready = ready
+                if not self._requested:
+                    return
+                self._requested = False
+
+    def wait(self, timeout: float = None):
+        thread = self._thread
+        if thread:
+            thread.join(timeout)
+
+    def take(self):
+        """ Returns (compiled, error) of the last finished reload, or None """
+
+        if self.watch and self._stat() != self._mtime:
+            self._mtime = self._stat()
+            self.request()
+
+        with self._lock:
+            ready, self._ready = self._ready, None
+
+        return ready
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*- pyversions=3.6+
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PollScheduler(object):
+    """ Inbox poll interval: drops to the minimum when SMS arrive and grows by
+    'decay' on every empty poll until the idle ceiling """
+
+    def __init__(self, min_interval: float, max_interval: float, decay: float = 2):
+        if min_interval > max_interval:
+            raise ValueError("Poll min interval (%s) greater than max interval (%s)" % (min_interval, max_interval))
+
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.decay = max(decay, 1)
+        self.interval = max_interval
+
+    @classmethod
+    def from_config(cls, conf):
+        poll = conf.get('poll', {})
+        return cls(min_interval=poll.get('min', conf['time']), max_interval=poll.get('max', conf['time']),
+                   decay=poll.get('decay', 2))
+
+    def next_interval(self, received: int = 0) -> float:
+        previous = self.interval
+        if received:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.decay, self.max_interval)
+
+        if self.interval != previous:
+            logger.info("Poll interval changed from %ss to %ss", previous, self.interval)
+
+        return self.interval
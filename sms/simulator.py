@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*- pyversions=3.6+
+
+import json
+import random
+import threading
+import time
+from argparse import ArgumentParser
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+
+from sms.modem import GET_CMD_PATH, SET_CMD_PATH, decode_ucs2, encode_ucs2
+
+
+class ModemState(object):
+    """ Inbox, sent messages and request counters of the simulated modem """
+
+    def __init__(self, latency: float = 0, error_rate: float = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.inbox = OrderedDict()
+        self.sent = []
+        self.requests = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+        self._next_id = 1
+
+    def inject(self, number: str, content: str) -> int:
+        with self.lock:
+            sms_id = self._next_id
+            self._next_id += 1
+            self.inbox[sms_id] = {'id': str(sms_id), 'number': number, 'content': encode_ucs2(content), 'tag': '1',
+                                  'date': time.strftime('%y,%m,%d,%H,%M,%S,+4'), 'received_at': time.monotonic()}
+
+            return sms_id
+
+    def burst(self, number: str, contents):
+        return [self.inject(number, content) for content in contents]
+
+    def unread(self):
+        with self.lock:
+            return [sms for sms in self.inbox.values() if sms['tag'] == '1']
+
+    def delete(self, ids):
+        with self.lock:
+            for sms_id in ids:
+                self.inbox.pop(int(sms_id), None)
+
+    def send(self, numbers, text: str):
+        with self.lock:
+            for number in numbers:
+                self.sent.append((time.monotonic(), number, text))
+
+
+class ModemRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def state(self) -> ModemState:
+        return self.server.state
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, body, status: int = 200):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def simulate(self) -> bool:
+        with self.state.lock:
+            self.state.requests += 1
+        if self.state.latency:
+            time.sleep(self.state.latency)
+        if self.state.error_rate and random.random() < self.state.error_rate:
+            with self.state.lock:
+                self.state.errors += 1
+            self.reply({'result': 'failure'}, status=500)
+            return False
+
+        return True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != GET_CMD_PATH:
+            self.reply({}, status=404)
+            return
+
+        if not self.simulate():
+            return
+
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        unread = self.state.unread()
+        if params.get('cmd') == 'sms_data_total':
+            self.reply({'messages': [{key: value for key, value in sms.items() if key != 'received_at'}
+                                     for sms in unread]})
+        else:
+            self.reply({'sms_received_flag': '1' if unread else '0', 'sms_unread_num': str(len(unread))})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        params = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode('utf-8')).items()}
+        if urlparse(self.path).path != SET_CMD_PATH:
+            self.reply({}, status=404)
+            return
+
+        if not self.simulate():
+            return
+
+        goform_id = params.get('goformId')
+        if goform_id == 'DELETE_SMS':
+            self.state.delete(sms_id for sms_id in params['msg_id'].split(';') if sms_id)
+        elif goform_id == 'SEND_SMS':
+            self.state.send(params['Number'].split(';'), decode_ucs2(params['MessageBody']))
+        else:
+            self.reply({'result': 'failure'})
+            return
+
+        self.reply({'result': 'success'})
+
+
+class ModemSimulator(ThreadingMixIn, HTTPServer):
+    """ Local stand-in for the HTTP API of the ZTE MF823, run in a background thread """
+
+    daemon_threads = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0, error_rate: float = 0):
+        HTTPServer.__init__(self, (host, port), ModemRequestHandler)
+        self.state = ModemState(latency=latency, error_rate=error_rate)
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return 'http://%s:%s' % (host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--host", help="Dirección en la que escucha el simulador", default='127.0.0.1')
+    parser.add_argument("--port", help="Puerto en el que escucha el simulador", default=8080, type=int)
+    parser.add_argument("--latency", help="Latencia de cada petición en segundos", default=0, type=float)
+    parser.add_argument("--error-rate", help="Proporción de peticiones que fallan", default=0, type=float)
+    args = parser.parse_args()
+
+    simulator = ModemSimulator(host=args.host, port=args.port, latency=args.latency, error_rate=args.error_rate)
+    print("Modem simulator listening on " + simulator.url)
+    try:
+        simulator.serve_forever()
+    except KeyboardInterrupt:
+        simulator.server_close()
+
+
+if __name__ == "__main__":
+    main()
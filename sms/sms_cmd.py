@@ -1,24 +1,44 @@
 #!/usr/bin/env python3.6
 # -*- coding: utf-8 -*- pyversions=3.6+
 
+import asyncio
 import logging.config
+import threading
 import time
+from collections import namedtuple
 from argparse import ArgumentParser
-from subprocess import DEVNULL, STDOUT, check_output, CalledProcessError
-
-from flatten_dict import flatten
+from concurrent.futures import ThreadPoolExecutor
+from subprocess import CalledProcessError, TimeoutExpired
 
 import buoy.lib.utils.config as load_config
 from buoy.lib.service.daemon import Daemon
 from buoy.lib.utils.argsparse import is_valid_file
-import sys
+from sms.alerts import AlertLimiter
+from sms.cache import ResultCache
+from sms.commands import EXCLUSIVE, CommandRegistry, CommandResult, plan_batch
+from sms.concurrency import CommandScheduler
+from sms.jobs import CANCELLED, DONE, FAILED, JobTable
+from sms.journal import RECEIVED, SMSJournal
+from sms.metrics import Counter, Gauge, Metrics, MetricsExporter
+from sms.modem import modem_from_config
+from sms.outbox import Outbox
+from sms.phones import PhoneAccess
+from sms.process import OutputBuffer, capture_output, capture_output_async, resolve_spawn_backend
+from sms.profiling import Profiler
+from sms.reload import ConfigReloader
+from sms.scheduler import PollScheduler
 
 DAEMON_NAME = 'sms-cmd'
+CACHED_SUFFIX = " (cached {:.0f}s ago)"
+BATCH_SEPARATOR = ';'
+JOB_SUFFIX = " (job {})"
 
 logger = logging.getLogger(__name__)
 
 
 class SMSExceptionBase(Exception):
+    alert_label = 'errors'
+
     def __init__(self, message: str, **kwargs):
         self.message = message
         self.phone = kwargs.pop('phone', None)
@@ -28,24 +48,40 @@ class SMSExceptionBase(Exception):
 
 
 class UnrecognizedCommandException(SMSExceptionBase):
+    alert_label = 'unrecognized commands'
+
     def __init__(self, command: str):
         SMSExceptionBase.__init__(self, message="Unrecognized command {command} sent from {phone}")
         self.command = command
 
 
 class UnauthorizedPhoneNumberException(SMSExceptionBase):
+    alert_label = 'unauthorized attempts'
+
     def __init__(self, phone: str):
         SMSExceptionBase.__init__(self, message="Unauthorized phone number {phone}")
         self.phone = phone
 
 
+class ForbiddenCommandException(SMSExceptionBase):
+    alert_label = 'forbidden commands'
+
+    def __init__(self, command: str, phone: str):
+        SMSExceptionBase.__init__(self, message="Command {command} not allowed for {phone}", phone=phone)
+        self.command = command
+
+
 class NotExistsCommandException(SMSExceptionBase):
+    alert_label = 'missing commands'
+
     def __init__(self, command: str):
         SMSExceptionBase.__init__(self, message="Not exists command {command}")
         self.command = command
 
 
 class NotExecutionCommand(SMSExceptionBase):
+    alert_label = 'failed commands'
+
     def __init__(self, command: str, code, error: str):
         SMSExceptionBase.__init__(self, message="ERROR: {error} | CMD: {command} | RC: {code}")
         self.command = command
@@ -53,30 +89,118 @@ class NotExecutionCommand(SMSExceptionBase):
         self.error = error
 
 
+class InterruptedCommandException(SMSExceptionBase):
+    alert_label = 'interrupted commands'
+
+    def __init__(self, command: str, phone: str):
+        SMSExceptionBase.__init__(self, message="Command {command} sent from {phone} interrupted by restart",
+                                  phone=phone)
+        self.command = command
+
+
+class JobLimitException(SMSExceptionBase):
+    alert_label = 'rejected jobs'
+
+    def __init__(self, command: str):
+        SMSExceptionBase.__init__(self, message="Too many background jobs, {command} sent from {phone} rejected")
+        self.command = command
+
+
+class ConfigReloadException(SMSExceptionBase):
+    alert_label = 'config errors'
+
+    def __init__(self, error):
+        SMSExceptionBase.__init__(self, message="Config reload failed, keeping previous config: {error}")
+        self.error = error
+
+
+AccessConfig = namedtuple('AccessConfig', ['commands', 'phone_access', 'alerts_phones'])
+
+
 class SMSCMDDaemon(Daemon):
-    def __init__(self, config):
+    def __init__(self, config, modem=None, config_file=None):
         Daemon.__init__(self, daemon_name=DAEMON_NAME, daemon_config=config['service'])
 
         conf = config['service']
         self.time = conf['time']
-        self.commands = config['commands']
-        self.authorized_phones = set(config['phones']['authorized'])
-        self.alerts_phones = set(config['phones']['alerts'])
+        self.scheduler = PollScheduler.from_config(conf)
+        self.mode = conf.get('mode', 'sync')
+        # Commands finished within this window get only the finished reply, without the started one
+        self.confirm_grace = conf.get('confirm_grace', 0)
+        self.spawn = resolve_spawn_backend(conf.get('spawn', 'subprocess'))
+        self.results = ResultCache(max_entries=conf.get('result_cache_size', 16))
+        self.alerts = AlertLimiter.from_config(config.get('alerts', {}))
+        self.modem = modem or modem_from_config(config)
+        self.journal = SMSJournal.from_config(config['journal']) if 'journal' in config else None
+        self.outbox = Outbox.from_config(config['outbox']) if 'outbox' in config else None
+        if self.outbox is not None:
+            self.modem.set_on_sent(self.outbox.sent)
+        self.metrics = Metrics()
+        self.exporter = MetricsExporter.from_config(self.metrics, config.get('metrics', {}))
+        self.profiler = Profiler.from_config(config['profiling'], prefix=DAEMON_NAME) if 'profiling' in config else None
+        self.jobs = JobTable.from_config(config.get('jobs', {}))
+        self.concurrency = CommandScheduler(on_wait=lambda waited: self.metrics.stage_duration.observe(waited, 'queue'))
+        self.builtins = {'profile': self.builtin_profile, 'jobs': self.builtin_jobs, 'status': self.builtin_status,
+                         'cancel': self.builtin_cancel, 'outbox': self.builtin_outbox}
+        self.apply_access(self.compile_access(config))
+        self.reloader = ConfigReloader(config_file, self.compile_access,
+                                       watch=conf.get('reload_watch', False)) if config_file else None
+        self.collapsed_confirms = self.metrics.add(Counter('sms_collapsed_confirms_total',
+                                                           'Started confirmations not sent thanks to the grace window'))
+        self.config_reloads = self.metrics.add(Counter('sms_config_reloads_total', 'Config reloads by result',
+                                                       labels=('result',)))
+        self.outbox_pending = self.metrics.add(Gauge('sms_outbox_pending', 'SMS waiting in the outbox'))
+        self.outbox_retries = self.metrics.add(Counter('sms_outbox_failures_total',
+                                                       'Outbox flushes failed and delayed for a retry'))
+        self.outbox_deduplicated = self.metrics.add(Counter('sms_outbox_deduplicated_total',
+                                                            'SMS absorbed by the same SMS already pending'))
         self.preffix_custom_cmd = "exec "
+        self._modem_executor = None
+        self._outbound_ready = None
+        self._job_tasks = set()
 
     def run(self):
+        self.exporter.start()
+        if self.profiler:
+            self.profiler.install_signals()
+        if self.reloader:
+            self.reloader.install_signals()
+        if self.mode == 'async':
+            self.run_async()
+            return
+
+        messages = self.resume_sms()
         while self.is_active():
-            messages = self.get_sms_unread()
+            self.reload_config()
+            messages += self.receive_sms()
+            messages.sort(key=self.message_priority, reverse=True)
             for sms in messages:
-                self.delete_sms(sms)
                 try:
-                    logger.info("Phone: " + sms['number'] + " - Content: " + sms['content'])
-                    self.check_authorized_phone(sms['number'])
-                    sms['command'] = self.get_command(sms['content'])
-                    self.send_confirm_started(sms)
-                    self.exectution_command(sms)
-                    if self.need_confirm(sms['command']):
-                        self.send_confirm_endend(sms)
+                    logger.info("Phone: %s - Content: %s", sms['number'], sms['content'])
+                    allowed = self.check_authorized_phone(sms['number'])
+                    commands = self.get_commands(sms['content'])
+                    self.check_allowed_commands(sms['number'], allowed, commands)
+                    if len(commands) > 1:
+                        self.mark_started(sms)
+                        self.send_batch_reply(sms, self.run_batch(sms, commands))
+                    elif commands[0].background:
+                        sms['command'] = commands[0]
+                        self.start_job(sms)
+                    else:
+                        sms['command'] = commands[0]
+                        if not self.get_cached_result(sms):
+                            self.wait_exclusive(sms['command'])
+                            if self.use_confirm_grace(sms['command']):
+                                self.mark_started(sms)
+                                self.exectution_command_grace(sms)
+                            else:
+                                self.send_confirm_started(sms)
+                                self.flush_sms()
+                                self.mark_started(sms)
+                                self.exectution_command(sms)
+                            self.cache_result(sms)
+                        if self.need_confirm(sms['command']):
+                            self.send_confirm_endend(sms)
 
                 except SMSExceptionBase as ex:
                     ex.phone = sms['number']
@@ -85,92 +209,671 @@ class SMSCMDDaemon(Daemon):
                 except BaseException as ex:
                     logging.info(ex)
                     self.error()
+                if 'job_id' not in sms:
+                    self.mark_done(sms)
+
+            self.notify_jobs()
+            self.send_alert_digest()
+            self.flush_sms()
+            self.exporter.write_textfile()
+            time.sleep(self.scheduler.next_interval(len(messages)))
+            messages = []
+
+        self.jobs.cancel_all()
+        self.close_journal()
+        self.close_outbox()
+        self.exporter.stop()
+
+    def run_async(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        # Modem API calls are blocking HTTP requests, they are serialized in a single worker thread
+        self._modem_executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            loop.run_until_complete(self.poll_inbox())
+        finally:
+            self._modem_executor.shutdown(wait=True)
+            loop.close()
+            self.close_journal()
+            self.close_outbox()
+            self.exporter.stop()
+
+    async def poll_inbox(self):
+        loop = asyncio.get_event_loop()
+        self._outbound_ready = asyncio.Event()
+        sender = loop.create_task(self.send_outbound())
+        pending = set()
+        messages = await self.modem_call(self.resume_sms)
+        self._outbound_ready.set()
+        while self.is_active():
+            if await self.modem_call(self.reload_config):
+                self._outbound_ready.set()
+            messages += await self.modem_call(self.receive_sms)
+            messages.sort(key=self.message_priority, reverse=True)
+            for sms in messages:
+                pending.add(loop.create_task(self.process_sms_async(sms)))
+
+            pending = {task for task in pending if not task.done()}
+            self._job_tasks = {task for task in self._job_tasks if not task.done()}
+            notified = await self.modem_call(self.notify_jobs)
+            if notified + await self.modem_call(self.send_alert_digest):
+                self._outbound_ready.set()
+            self.exporter.write_textfile()
+            await asyncio.sleep(self.scheduler.next_interval(len(messages)))
+            messages = []
+
+        if pending:
+            await asyncio.wait(pending)
+        self.jobs.cancel_all()
+        if self._job_tasks:
+            await asyncio.wait(self._job_tasks)
+
+        sender.cancel()
+        await self.modem_call(self.flush_sms)
+
+    async def send_outbound(self):
+        while True:
+            await self._outbound_ready.wait()
+            self._outbound_ready.clear()
+            delay = await self.modem_call(self.flush_sms, False)
+            while delay:
+                await asyncio.sleep(delay)
+                delay = await self.modem_call(self.flush_sms, False)
+
+    async def process_sms_async(self, sms):
+        try:
+            logger.info("Phone: %s - Content: %s", sms['number'], sms['content'])
+            allowed = self.check_authorized_phone(sms['number'])
+            commands = self.get_commands(sms['content'])
+            self.check_allowed_commands(sms['number'], allowed, commands)
+            if len(commands) > 1:
+                await self.modem_call(self.mark_started, sms)
+                items = await self.run_batch_async(sms, commands)
+                await self.modem_call(self.send_batch_reply, sms, items)
+                self._outbound_ready.set()
+            elif commands[0].background:
+                sms['command'] = commands[0]
+                await self.start_job_async(sms)
+            else:
+                sms['command'] = commands[0]
+                if not self.get_cached_result(sms):
+                    async with self.concurrency.slot(sms['command']):
+                        if self.use_confirm_grace(sms['command']):
+                            await self.modem_call(self.mark_started, sms)
+                            await self.exectution_command_grace_async(sms)
+                        else:
+                            await self.modem_call(self.send_confirm_started, sms)
+                            self._outbound_ready.set()
+                            await self.modem_call(self.mark_started, sms)
+                            await self.exectution_command_async(sms)
+                    self.cache_result(sms)
+                if self.need_confirm(sms['command']):
+                    await self.modem_call(self.send_confirm_endend, sms)
+                    self._outbound_ready.set()
+
+        except SMSExceptionBase as ex:
+            ex.phone = sms['number']
+            await self.modem_call(self.send_error, ex)
+            self._outbound_ready.set()
+        except Exception as ex:
+            logging.info(ex)
+            self.error()
 
-            time.sleep(self.time)
+        if 'job_id' not in sms:
+            await self.modem_call(self.mark_done, sms)
 
-    @staticmethod
-    def exectution_command(sms):
-        cmd = sms['command']['cli']
-        active_shell = not isinstance(cmd, list)
+    def modem_call(self, func, *args):
+        return asyncio.get_event_loop().run_in_executor(self._modem_executor, func, *args)
+
+    def exectution_command(self, sms, on_start=None):
+        command = sms['command']
+        start = time.monotonic()
+        try:
+            if command.builtin:
+                output = self.run_builtin(command)
+            else:
+                output = capture_output(command.cli, timeout=command.timeout, limit=command.output_limit,
+                                        on_start=on_start, spawn=self.spawn)
+            SMSCMDDaemon.set_command_output(sms, output)
+        except CalledProcessError as ex:
+            self.metrics.command_errors.inc(command.key)
+            raise NotExecutionCommand(command=ex.cmd, code=ex.returncode, error=ex.stderr)
+        except TimeoutExpired as ex:
+            self.metrics.command_errors.inc(command.key)
+            raise NotExecutionCommand(command=ex.cmd, code=None, error="Timeout after %ss" % ex.timeout)
+        finally:
+            self.metrics.command_duration.observe(time.monotonic() - start, command.key)
+
+    async def exectution_command_async(self, sms, on_start=None):
+        command = sms['command']
+        start = time.monotonic()
         try:
-            sms['command']['output'] = check_output(cmd, stderr=STDOUT, shell=active_shell).decode("utf-8")
+            if command.builtin:
+                output = self.run_builtin(command)
+            else:
+                output = await capture_output_async(command.cli, timeout=command.timeout, limit=command.output_limit,
+                                                    on_start=on_start, spawn=self.spawn)
+            SMSCMDDaemon.set_command_output(sms, output)
         except CalledProcessError as ex:
+            self.metrics.command_errors.inc(command.key)
             raise NotExecutionCommand(command=ex.cmd, code=ex.returncode, error=ex.stderr)
+        except TimeoutExpired as ex:
+            self.metrics.command_errors.inc(command.key)
+            raise NotExecutionCommand(command=ex.cmd, code=None, error="Timeout after %ss" % ex.timeout)
+        finally:
+            self.metrics.command_duration.observe(time.monotonic() - start, command.key)
+
+    def run_batch(self, sms, commands):
+        items = [dict(sms, command=command) for command in commands]
+        failed = set()
+        for wave in plan_batch(commands):
+            for index in wave:
+                self.run_batch_item(items[index], failed)
+            failed.update(SMSCMDDaemon.failed_keys(items, wave))
+
+        return items
+
+    async def run_batch_async(self, sms, commands):
+        items = [dict(sms, command=command) for command in commands]
+        failed = set()
+        for wave in plan_batch(commands):
+            await asyncio.gather(*[self.run_batch_item_async(items[index], failed) for index in wave])
+            failed.update(SMSCMDDaemon.failed_keys(items, wave))
+
+        return items
+
+    def run_batch_item(self, item, failed):
+        if self.skip_batch_item(item, failed):
+            return
+
+        try:
+            if not self.get_cached_result(item):
+                self.wait_exclusive(item['command'])
+                self.exectution_command(item)
+                self.cache_result(item)
+        except SMSExceptionBase as ex:
+            item['error'] = ex
+
+    async def run_batch_item_async(self, item, failed):
+        if self.skip_batch_item(item, failed):
+            return
+
+        try:
+            if not self.get_cached_result(item):
+                async with self.concurrency.slot(item['command']):
+                    await self.exectution_command_async(item)
+                self.cache_result(item)
+        except SMSExceptionBase as ex:
+            item['error'] = ex
+
+    @staticmethod
+    def skip_batch_item(item, failed):
+        item['skipped'] = [dependency for dependency in item['command'].depends_on if dependency in failed]
+        return bool(item['skipped'])
+
+    @staticmethod
+    def failed_keys(items, wave):
+        return [items[index]['command'].key for index in wave if 'error' in items[index] or items[index]['skipped']]
+
+    def compile_access(self, config) -> AccessConfig:
+        """ Validates and compiles the commands and phones of a configuration """
+
+        commands = CommandRegistry(config['commands'])
+        for key in commands:
+            builtin = commands[key].builtin
+            if builtin and builtin not in self.builtins:
+                raise ValueError("Command %s: unknown builtin %s" % (key, builtin))
+
+        phone_access = PhoneAccess.from_config(config['phones'])
+        unknown = [key for key in phone_access.commands() if key not in commands]
+        if unknown:
+            raise ValueError("Phone groups: unknown commands %s" % ", ".join(sorted(unknown)))
+
+        return AccessConfig(commands=commands, phone_access=phone_access,
+                            alerts_phones=frozenset(phone_access.numbering.normalize(phone)
+                                                    for phone in config['phones']['alerts']))
+
+    def apply_access(self, access: AccessConfig):
+        self.commands = access.commands
+        self.phone_access = access.phone_access
+        self.alerts_phones = access.alerts_phones
+
+    def reload_config(self):
+        """ Swaps in the config compiled by the reloader, if any. Returns True when an alert was queued """
+
+        ready = self.reloader.take() if self.reloader else None
+        if ready is None:
+            return False
+
+        access, error = ready
+        if error is not None:
+            logger.error("Config reload failed, keeping previous config: %s", error)
+            self.config_reloads.inc('error')
+            self.send_error(ConfigReloadException(error=error))
+            return True
+
+        self.apply_access(access)
+        self.config_reloads.inc('ok')
+        logger.info("Config reloaded: %s commands, %s authorized phones", len(access.commands),
+                    len(access.phone_access.phones))
+        return False
+
+    def message_priority(self, sms):
+        try:
+            return max(command.priority for command in self.get_commands(sms['content']))
+        except SMSExceptionBase:
+            return 0
+
+    def wait_exclusive(self, command):
+        """ Sync mode runs one command at a time, exclusive ones also wait for the background jobs """
+
+        if command.concurrency == EXCLUSIVE and len(self.jobs):
+            logger.info("Waiting for background jobs before running %s", command.key)
+            self.jobs.wait_idle()
+
+    def use_confirm_grace(self, command):
+        return self.confirm_grace > 0 and self.need_confirm(command)
+
+    def exectution_command_grace(self, sms):
+        """ Runs the command and sends the started confirmation only if it is still
+        running when the grace window expires """
+
+        started = []
+
+        def confirm_started():
+            self.send_confirm_started(sms)
+            self.flush_sms()
+            started.append(True)
+
+        timer = threading.Timer(self.confirm_grace, confirm_started)
+        timer.start()
+        error = None
+        try:
+            self.exectution_command(sms)
+        except SMSExceptionBase as ex:
+            error = ex
+        finally:
+            timer.cancel()
+            timer.join()
+
+        if not started:
+            if error is not None:
+                self.send_error_reply(sms, error)
+            else:
+                self.collapsed_confirms.inc()
+        if error is not None:
+            raise error
+
+    async def exectution_command_grace_async(self, sms):
+        task = asyncio.ensure_future(self.exectution_command_async(sms))
+        done, _ = await asyncio.wait([task], timeout=self.confirm_grace)
+        if not done:
+            await self.modem_call(self.send_confirm_started, sms)
+            self._outbound_ready.set()
+            await task
+            return
+
+        try:
+            task.result()
+        except SMSExceptionBase as ex:
+            await self.modem_call(self.send_error_reply, sms, ex)
+            self._outbound_ready.set()
+            raise
+
+        self.collapsed_confirms.inc()
+
+    def start_job(self, sms):
+        job = self.jobs.start(sms)
+        if job is None:
+            raise JobLimitException(command=sms['command'].key)
+
+        self.mark_started(sms)
+        self.send_job_started(sms)
+        threading.Thread(target=self.run_job, args=(job,), daemon=True).start()
+
+    async def start_job_async(self, sms):
+        job = self.jobs.start(sms)
+        if job is None:
+            raise JobLimitException(command=sms['command'].key)
+
+        await self.modem_call(self.mark_started, sms)
+        await self.modem_call(self.send_job_started, sms)
+        self._outbound_ready.set()
+        self._job_tasks.add(asyncio.get_event_loop().create_task(self.run_job_async(job)))
+
+    def run_job(self, job):
+        try:
+            self.exectution_command(job.sms, on_start=lambda pid: self.jobs.attach(job, pid))
+        except SMSExceptionBase as ex:
+            self.jobs.finish(job, error=ex)
+        except Exception as ex:
+            self.jobs.finish(job, error=NotExecutionCommand(command=job.command.cli, code=None, error=str(ex)))
+        else:
+            self.jobs.finish(job)
+
+    async def run_job_async(self, job):
+        try:
+            async with self.concurrency.slot(job.command):
+                await self.exectution_command_async(job.sms, on_start=lambda pid: self.jobs.attach(job, pid))
+        except SMSExceptionBase as ex:
+            self.jobs.finish(job, error=ex)
+        except Exception as ex:
+            self.jobs.finish(job, error=NotExecutionCommand(command=job.command.cli, code=None, error=str(ex)))
+        else:
+            self.jobs.finish(job)
+
+    def notify_jobs(self):
+        """ Replies to the sender of every background job finished since the last call """
+
+        finished = self.jobs.take_finished()
+        for job in finished:
+            sms = job.sms
+            msg = None
+            if job.state == FAILED:
+                job.error.phone = sms['number']
+                self.send_error(job.error)
+                msg = self.error_message(sms, job.error)
+            elif job.state == DONE and self.need_confirm(job.command):
+                msg = self.finished_message(sms)
+            if msg is not None:
+                msg += JOB_SUFFIX.format(job.id)
+                logger.info("Send job message '%s' to '%s'", msg, sms['number'])
+                self.send_sms(sms['number'], msg)
+            self.mark_done(sms)
+
+        return len(finished)
+
+    def builtin_jobs(self, args):
+        jobs = self.jobs.jobs()
+        return "\n".join(job.describe() for job in jobs) if jobs else "No jobs"
+
+    def builtin_status(self, args):
+        job = self.jobs.get(args.strip())
+        if job is None:
+            return "Unknown job %s" % args.strip()
+
+        if job.state == DONE:
+            return "%s: %s" % (job.describe(), job.sms['result'].output)
+        if job.state == FAILED:
+            return "%s: %s" % (job.describe(), job.error)
+
+        return job.describe()
+
+    def builtin_cancel(self, args):
+        job = self.jobs.cancel(args.strip())
+        return "Job %s %s" % (args.strip(), CANCELLED if job else "not running")
+
+    def run_builtin(self, command):
+        output = self.builtins[command.builtin](command.cli or '')
+        return OutputBuffer.from_bytes(output.encode('utf-8'), limit=command.output_limit)
+
+    def builtin_outbox(self, args):
+        if self.outbox is None:
+            return "Outbox disabled"
+
+        return self.outbox.describe()
+
+    def builtin_profile(self, args):
+        if not self.profiler:
+            return "Profiling disabled"
+
+        return self.profiler.command(args)
+
+    @staticmethod
+    def set_command_output(sms, output):
+        sms['result'] = CommandResult(output=output.getvalue().decode("utf-8", errors="replace"),
+                                      output_bytes=output.total, truncated_bytes=output.truncated)
+
+    def receive_sms(self):
+        messages = self.get_sms_unread()
+        if not messages:
+            return []
+
+        self.metrics.received.inc(value=len(messages))
+        received = messages
+        if self.journal is not None:
+            received = [sms for sms in messages if not self.journal.seen(sms)]
+            self.journal.received(received)
+        self.delete_sms(messages)
+
+        return received
+
+    def resume_sms(self):
+        if self.journal is None:
+            return []
+
+        resumed = []
+        for state, sms in self.journal.unfinished():
+            if state == RECEIVED:
+                logger.info("Resuming SMS %s from %s", sms['id'], sms['number'])
+                resumed.append(sms)
+            else:
+                self.journal.done(sms)
+                self.send_error(InterruptedCommandException(command=sms['content'], phone=sms['number']))
+
+        return resumed
+
+    def mark_started(self, sms):
+        if self.journal is not None:
+            self.journal.started(sms)
+
+    def mark_done(self, sms):
+        if self.journal is not None:
+            self.journal.done(sms)
+
+    def close_journal(self):
+        if self.journal is not None:
+            self.journal.close()
+
+    def close_outbox(self):
+        if self.outbox is not None:
+            self.outbox.close()
+
+    def get_cached_result(self, sms):
+        command = sms['command']
+        cached = self.results.get((command.key, command.cli)) if command.cache_ttl else None
+        if cached is None:
+            return False
+
+        result, age = cached
+        sms['result'] = result._replace(cached=age)
+        logger.info("Reusing result of %s cached %ds ago", command.key, age)
+        return True
+
+    def cache_result(self, sms):
+        command = sms['command']
+        if command.cache_ttl and 'result' in sms:
+            self.results.put((command.key, command.cli), sms['result'], ttl=command.cache_ttl)
 
     def get_sms_unread(self):
-        import vodem.simple
         try:
-            return vodem.simple.sms_inbox_unread()
+            with self.metrics.modem('inbox'):
+                return self.modem.sms_unread()
         except Exception as e:
             self.error()
 
     def check_authorized_phone(self, number):
-        if number in self.authorized_phones:
-            return True
+        """ Returns the commands the number may run """
+
+        with self.metrics.stage('authorize'):
+            allowed = self.phone_access.allowed(number)
+            if allowed is not None:
+                return allowed
 
         raise UnauthorizedPhoneNumberException(number)
 
+    @staticmethod
+    def check_allowed_commands(number, allowed, commands):
+        for command in commands:
+            if command.key not in allowed:
+                raise ForbiddenCommandException(command=command.key, phone=number)
+
+    def get_commands(self, content):
+        """ Resolves the commands of an SMS separated by ';'. An exec command takes the rest of the SMS """
+
+        if BATCH_SEPARATOR not in content or content.startswith(self.preffix_custom_cmd):
+            return [self.get_command(content)]
+
+        commands = []
+        rest = content
+        while rest:
+            part, _, rest = rest.partition(BATCH_SEPARATOR)
+            part = part.strip()
+            if part.startswith(self.preffix_custom_cmd) and rest:
+                part, rest = part + BATCH_SEPARATOR + rest, ''
+            if part:
+                commands.append(self.get_command(part))
+
+        if not commands:
+            raise UnrecognizedCommandException(command=content)
+
+        return commands
+
     def get_command(self, cmd_key):
+        key, _, args = cmd_key.partition(' ')
         if cmd_key in self.commands:
             cmd = self.commands[cmd_key]
         elif cmd_key.startswith(self.preffix_custom_cmd):
-            cmd = self.commands[self.preffix_custom_cmd[:-1]]
-            cmd['cli'] = cmd_key[len(self.preffix_custom_cmd):]
+            cmd = self.commands[self.preffix_custom_cmd[:-1]]._replace(cli=cmd_key[len(self.preffix_custom_cmd):])
+        elif key in self.commands and self.commands[key].builtin:
+            cmd = self.commands[key]._replace(cli=args)
         else:
             raise UnrecognizedCommandException(command=cmd_key)
 
         return cmd
 
     def send_confirm_started(self, sms):
-        sms_flat = self.flatten(sms)
-        msg = sms['command']['msg']['started'].format(**sms_flat)
-        logger.info("Send confirmation started message '" + msg + "' to '" + sms['number'] + "'")
+        if 'started' not in sms['command'].templates:
+            return
+
+        msg = sms['command'].render('started', sms)
+        logger.info("Send confirmation started message '%s' to '%s'", msg, sms['number'])
         self.send_sms(sms['number'], msg)
 
+    @staticmethod
+    def finished_message(sms):
+        msg = sms['command'].render('finished', sms)
+        if sms.get('result') and sms['result'].cached is not None:
+            msg += CACHED_SUFFIX.format(sms['result'].cached)
+
+        return msg
+
     def send_confirm_endend(self, sms):
-        sms_flat = self.flatten(sms)
-        msg = sms['command']['msg']['finished'].format(**sms_flat)
-        logger.info("Send finished endend message '" + msg + "' to '" + sms['number'] + "'")
+        msg = self.finished_message(sms)
+        logger.info("Send finished endend message '%s' to '%s'", msg, sms['number'])
+        self.send_sms(sms['number'], msg)
+
+    @staticmethod
+    def error_message(sms, exception: SMSExceptionBase):
+        command = sms['command']
+        return command.render('error', sms) if 'error' in command.templates else str(exception)
+
+    def send_job_started(self, sms):
+        command = sms['command']
+        msg = command.render('started', sms) if 'started' in command.templates else command.key
+        msg += JOB_SUFFIX.format(sms['job_id'])
+        logger.info("Send job started message '%s' to '%s'", msg, sms['number'])
+        self.send_sms(sms['number'], msg)
+
+    def send_error_reply(self, sms, exception: SMSExceptionBase):
+        """ Tells the sender that the command failed when no started confirmation was sent """
+
+        exception.phone = sms['number']
+        msg = self.error_message(sms, exception)
+        logger.info("Send error message '%s' to '%s'", msg, sms['number'])
+        self.send_sms(sms['number'], msg)
+
+    def send_batch_reply(self, sms, items):
+        """ Sends one SMS with a line per command of the batch, failed commands are also alerted """
+
+        lines = []
+        for item in items:
+            command = item['command']
+            if item['skipped']:
+                lines.append("%s: skipped, %s failed" % (command.key, ", ".join(item['skipped'])))
+            elif 'error' in item:
+                item['error'].phone = sms['number']
+                self.send_error(item['error'])
+                lines.append(command.render('error', item) if 'error' in command.templates
+                             else "%s: %s" % (command.key, item['error']))
+            elif self.need_confirm(command):
+                lines.append(self.finished_message(item))
+            else:
+                lines.append("%s: done" % command.key)
+
+        msg = "\n".join(lines)
+        logger.info("Send batch reply '%s' to '%s'", msg, sms['number'])
         self.send_sms(sms['number'], msg)
 
     def send_error(self, exception: SMSExceptionBase):
-        for phone in self.alerts_phones:
+        for phone in self.alerts.filter(exception, self.alerts_phones):
             self.send_sms(phone, str(exception))
 
+    def send_alert_digest(self):
+        digest = self.alerts.digest()
+        for phone, msg in digest:
+            logger.info("Send alert digest '%s' to '%s'", msg, phone)
+            self.send_sms(phone, msg)
+
+        return len(digest)
+
     @staticmethod
     def need_confirm(command):
-        return 'finished' in command['msg']
+        return 'finished' in command.templates
 
-    @staticmethod
-    def send_sms(phone, msg):
-        import vodem.simple
-        vodem.simple.sms_send(phone, msg)
+    def send_sms(self, phone, msg):
+        if self.outbox is None:
+            self.modem.queue_sms(phone, msg)
+        elif self.outbox.put(phone, msg) is None:
+            self.outbox_deduplicated.inc()
 
-    @staticmethod
-    def delete_sms(sms):
-        import vodem.simple
-        vodem.simple.sms_delete(sms['id'])
-        logging.info("SMS deleted: " + sms['content'])
+    def flush_sms(self, wait=True):
+        if self.outbox is not None:
+            return self.flush_outbox(wait)
 
-    @staticmethod
-    def flatten(d):
-        def underscore_reducer(k1, k2):
-            if k1 is None:
-                return k2
-            else:
-                return k1 + "_" + k2
+        with self.metrics.modem('send'):
+            return self.modem.flush_sms(wait)
 
-        f = flatten(d, reducer=underscore_reducer)
-        if isinstance(f['command_cli'], list):
-            f['command_cli'] = " ".join(f['command_cli'])
-        return f
+    def flush_outbox(self, wait=True):
+        """ Hands the due SMS of the outbox to the modem in batches. A modem failure is not
+        raised, the SMS wait in the outbox. Returns the seconds until the next send or retry """
+
+        try:
+            while True:
+                batch = self.outbox.due()
+                for key, phone, text in batch:
+                    self.modem.queue_sms(phone, text, key)
+                # Queued SMS are on disk before the modem is asked to send them
+                self.outbox.commit()
+                try:
+                    with self.metrics.modem('send'):
+                        delay = self.modem.flush_sms(wait)
+                except Exception as ex:
+                    self.modem.clear_sms()
+                    retry = self.outbox.failed()
+                    self.outbox_retries.inc()
+                    logger.warning("Sending SMS failed, %s kept in the outbox, retry in %.0fs: %s",
+                                   len(self.outbox), retry, ex)
+                    return retry
+
+                if delay or not batch:
+                    return delay or self.outbox.retry_in()
+        finally:
+            self.outbox.commit()
+            self.outbox_pending.set(len(self.outbox))
+
+    def delete_sms(self, messages):
+        with self.metrics.modem('delete'):
+            self.modem.delete_sms([sms['id'] for sms in messages])
+        for sms in messages:
+            logger.info("SMS deleted: %s", sms['content'])
 
 
 def run(config: str, config_log_file: str):
     logging.config.dictConfig(load_config.load_config_logger(path_config=config_log_file))
     buoy_config = load_config.load_config(path_config=config)
 
-    daemon = SMSCMDDaemon(config=buoy_config)
+    daemon = SMSCMDDaemon(config=buoy_config, config_file=config)
     daemon.start()
 
 
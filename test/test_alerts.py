@@ -0,0 +1,66 @@
+import unittest
+
+from nose.tools import ok_, eq_
+
+from sms.alerts import AlertLimiter, TokenBucket
+
+
+class FakeError(Exception):
+    alert_label = 'unauthorized attempts'
+
+    def __init__(self, phone):
+        self.phone = phone
+
+
+class OtherError(Exception):
+    alert_label = 'failed commands'
+    phone = None
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_should_allowBurstOnly_when_noTimeElapsed(self):
+        bucket = TokenBucket(per_hour=1, burst=3)
+
+        eq_([bucket.consume() for _ in range(5)], [True, True, True, False, False])
+
+    def test_should_refillTokens_when_timeElapsed(self):
+        bucket = TokenBucket(per_hour=3600, burst=1)
+        bucket.consume()
+        bucket.updated_at -= 1
+
+        ok_(bucket.consume())
+
+
+class TestAlertLimiter(unittest.TestCase):
+
+    def test_should_allowAll_when_noLimitsConfigured(self):
+        limiter = AlertLimiter.from_config({})
+        phones = ['+34666666666', '+34666666667']
+
+        for _ in range(20):
+            eq_(limiter.filter(FakeError('5020'), phones), phones)
+        eq_(limiter.digest(force=True), [])
+
+    def test_should_suppressAlerts_when_typeLimitReached(self):
+        limiter = AlertLimiter(type_per_hour=1, type_burst=2, digest_interval=600)
+        phones = ['+34666666666']
+
+        allowed = [limiter.filter(FakeError(number), phones) for number in ['5020', '5021', '5022', '5022', '5023']]
+
+        eq_(allowed, [phones, phones, [], [], []])
+        eq_(limiter.filter(OtherError(), phones), phones)
+        eq_(limiter.digest(), [])
+        eq_(limiter.digest(force=True), [('+34666666666', '3 unauthorized attempts from 2 numbers in last 10 min')])
+        eq_(limiter.digest(force=True), [])
+
+    def test_should_suppressPerPhone_when_phoneLimitReached(self):
+        limiter = AlertLimiter(phone_per_hour=1, phone_burst=1)
+        limiter.filter(OtherError(), ['+34666666666'])
+
+        eq_(limiter.filter(OtherError(), ['+34666666666', '+34666666667']), ['+34666666667'])
+        eq_(limiter.digest(force=True), [('+34666666666', '1 failed commands in last 10 min')])
+
+
+if __name__ == '__main__':
+    unittest.main()
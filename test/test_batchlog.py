@@ -0,0 +1,145 @@
+import logging
+import logging.config
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from nose.tools import ok_, eq_
+
+from sms.batchlog import BatchedFileHandler
+
+
+class TestBatchedFileHandler(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'sms-cmd.log')
+        self.logger = logging.getLogger('test.batchlog')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.handlers = []
+
+    def tearDown(self):
+        for handler in self.handlers:
+            self.logger.removeHandler(handler)
+            handler.close()
+        shutil.rmtree(self.dir)
+
+    def handler(self, **kwargs):
+        handler = BatchedFileHandler(self.path, **kwargs)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        self.logger.addHandler(handler)
+        self.handlers.append(handler)
+        return handler
+
+    def record(self, msg, *args):
+        return logging.makeLogRecord({'msg': msg, 'args': args, 'levelno': logging.INFO})
+
+    def read(self, path=None):
+        if not os.path.exists(path or self.path):
+            return ''
+        with open(path or self.path) as f:
+            return f.read()
+
+    def test_should_keepRecordsInBatch_when_batchNotFull(self):
+        self.handler(batch_bytes=1024, flush_interval=60)
+
+        self.logger.info("Phone: %s - Content: %s", '+34600000000', 'public_ip')
+        time.sleep(0.1)
+
+        eq_(self.read(), '')
+
+    def test_should_writeBatch_when_batchBytesReached(self):
+        self.handler(batch_bytes=20, flush_interval=60)
+
+        self.logger.info("Phone: %s - Content: %s", '+34600000000', 'public_ip')
+        time.sleep(0.2)
+
+        eq_(self.read(), "Phone: +34600000000 - Content: public_ip\n")
+
+    def test_should_writeBatch_when_flushIntervalElapsed(self):
+        self.handler(batch_bytes=1024, flush_interval=0.1)
+
+        self.logger.info("SMS deleted: %s", 'public_ip')
+        time.sleep(0.4)
+
+        eq_(self.read(), "SMS deleted: public_ip\n")
+
+    def test_should_writePendingRecords_when_flushOrClose(self):
+        handler = self.handler(batch_bytes=1024, flush_interval=60)
+
+        self.logger.info("first")
+        handler.flush()
+        eq_(self.read(), "first\n")
+
+        self.logger.info("second")
+        handler.close()
+        eq_(self.read(), "first\nsecond\n")
+
+    def test_should_formatInWriter_when_recordQueued(self):
+        handler = self.handler(batch_bytes=1024, flush_interval=60)
+        formatted = []
+
+        class Arg(object):
+            def __str__(self):
+                formatted.append(threading.current_thread().name)
+                return 'arg'
+
+        handler.handle(self.record("lazy %s", Arg()))
+        handler.flush()
+
+        eq_(formatted, ['log-writer'])
+        eq_(self.read(), "lazy arg\n")
+
+    def test_should_rotateFile_when_maxBytesExceeded(self):
+        handler = self.handler(max_bytes=30, backup_count=2, batch_bytes=1)
+
+        for index in range(4):
+            self.logger.info("message number %s", index)
+            handler.flush()
+
+        eq_(self.read(), "message number 3\n")
+        eq_(self.read(self.path + ".1"), "message number 2\n")
+        eq_(self.read(self.path + ".2"), "message number 1\n")
+        ok_(not os.path.exists(self.path + ".3"))
+
+    def test_should_countDroppedRecords_when_queueFull(self):
+        handler = self.handler(batch_bytes=1024, flush_interval=60, queue_size=1)
+        release = threading.Event()
+
+        class Stalled(object):
+            def __str__(self):
+                release.wait()
+                return 'stalled'
+
+        # The writer blocks formatting the first record, the second fills the queue
+        handler.handle(self.record("%s", Stalled()))
+        time.sleep(0.1)
+        for index in range(4):
+            handler.handle(self.record("message number %s", index))
+        release.set()
+        handler.flush()
+
+        eq_(self.read(), "3 records dropped, log queue full\nstalled\nmessage number 0\n")
+
+    def test_should_createHandler_when_configuredWithFactory(self):
+        logging.config.dictConfig({
+            'version': 1,
+            'disable_existing_loggers': False,
+            'formatters': {'simple': {'format': '%(levelname)s - %(message)s'}},
+            'handlers': {'file': {'()': 'sms.batchlog.BatchedFileHandler', 'formatter': 'simple',
+                                  'filename': self.path, 'batch_bytes': 1024, 'flush_interval': 60}},
+            'loggers': {'test.batchlog.config': {'handlers': ['file'], 'propagate': False}}
+        })
+        logger = logging.getLogger('test.batchlog.config')
+        handler = logger.handlers[0]
+        self.handlers.append(handler)
+
+        logger.warning("Config reloaded")
+        handler.flush()
+
+        ok_(isinstance(handler, BatchedFileHandler))
+        eq_(self.read(), "WARNING - Config reloaded\n")
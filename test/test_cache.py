@@ -0,0 +1,40 @@
+import time
+import unittest
+
+from nose.tools import ok_, eq_
+
+from sms.cache import ResultCache
+
+
+class TestResultCache(unittest.TestCase):
+
+    def test_should_returnResult_when_insideTTL(self):
+        cache = ResultCache()
+        cache.put('public_ip', '127.0.0.1', ttl=60)
+
+        result, age = cache.get('public_ip')
+        eq_(result, '127.0.0.1')
+        ok_(0 <= age < 1)
+
+    def test_should_evictEntry_when_ttlExpired(self):
+        cache = ResultCache()
+        cache.put('public_ip', '127.0.0.1', ttl=0.1)
+        time.sleep(0.15)
+
+        eq_(cache.get('public_ip'), None)
+        eq_(len(cache), 0)
+
+    def test_should_evictLeastRecentlyUsed_when_maxEntriesReached(self):
+        cache = ResultCache(max_entries=2)
+        cache.put('a', 1, ttl=60)
+        cache.put('b', 2, ttl=60)
+        cache.get('a')
+        cache.put('c', 3, ttl=60)
+
+        eq_(cache.get('b'), None)
+        eq_(cache.get('a')[0], 1)
+        eq_(cache.get('c')[0], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+
+from nose.tools import ok_, eq_
+
+from sms.commands import Command, CommandRegistry, CommandResult, Template, plan_batch
+
+
+class TestTemplate(unittest.TestCase):
+
+    def test_should_resolveOnlyUsedFields_when_compiled(self):
+        template = Template('Public IP: {command_output} ({command_truncated_bytes} bytes truncated)')
+
+        eq_(set(template.fields), {'command_output', 'command_truncated_bytes'})
+
+    def test_should_throwValueError_when_unknownField(self):
+        self.assertRaises(ValueError, Template, 'Modem rebooted: {ouput}')
+
+    def test_should_renderSMSAndCommandFields(self):
+        command = Command.from_config('exec', {'msg': {'started': '{number} runs {command_cli!r}'},
+                                               'cli': ['ls', '-la']})
+        sms = {'id': 1, 'number': '+34666666666', 'content': 'exec ls -la', 'command': command}
+
+        eq_(command.render('started', sms), "+34666666666 runs 'ls -la'")
+
+    def test_should_renderResultFields_when_commandExecuted(self):
+        command = Command.from_config('public_ip', {'msg': {'finished': 'Public IP: {command_output}'}, 'cli': 'ip'})
+        sms = {'command': command, 'result': CommandResult(output='127.0.0.1', output_bytes=9, truncated_bytes=0)}
+
+        eq_(command.render('finished', sms), 'Public IP: 127.0.0.1')
+
+
+class TestCommandRegistry(unittest.TestCase):
+
+    def test_should_compileAllCommands_when_created(self):
+        registry = CommandRegistry({'public_ip': {'msg': {'started': 'Getting IP'}, 'cli': 'public-ip', 'timeout': 5}})
+
+        ok_('public_ip' in registry)
+        eq_(registry['public_ip'].timeout, 5)
+
+    def test_should_notShareState_when_commandReplaced(self):
+        registry = CommandRegistry({'exec': {'msg': {'started': 'Executing {command_cli}'}}})
+        command = registry['exec']._replace(cli='ls')
+
+        eq_(command.cli, 'ls')
+        eq_(registry['exec'].cli, None)
+        with self.assertRaises(TypeError):
+            command.templates['finished'] = Template('')
+
+    def test_should_throwValueError_when_templateHasUnknownField(self):
+        self.assertRaises(ValueError, CommandRegistry, {'exec': {'msg': {'started': '{command_foo}'}}})
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+    def test_should_throwValueError_when_unknownConcurrencyClass(self):
+        self.assertRaises(ValueError, CommandRegistry, {'reboot_computer': {'msg': {}, 'concurrency': 'serial'}})
+
+    def test_should_useKeyAsMutex_when_notDeclared(self):
+        registry = CommandRegistry({'exec': {'msg': {}}, 'update_dns': {'msg': {}, 'mutex': 'network'}})
+
+        eq_((registry['exec'].concurrency, registry['exec'].mutex), ('mutex', 'exec'))
+        eq_(registry['update_dns'].mutex, 'network')
+
+    def test_should_throwValueError_when_dependsOnUnknownCommand(self):
+        self.assertRaises(ValueError, CommandRegistry, {'update_dns': {'msg': {}, 'depends_on': ['connect_vpn']}})
+
+    def test_should_throwValueError_when_circularDependencies(self):
+        self.assertRaises(ValueError, CommandRegistry, {'a': {'msg': {}, 'depends_on': ['b']},
+                                                        'b': {'msg': {}, 'depends_on': ['a']}})
+
+
+class TestPlanBatch(unittest.TestCase):
+
+    def test_should_groupIndependentCommands_when_noDependencies(self):
+        registry = CommandRegistry({'public_ip': {'msg': {}}, 'update_dns': {'msg': {}}})
+
+        eq_(plan_batch([registry['public_ip'], registry['update_dns']]), [[0, 1]])
+
+    def test_should_runDependencyFirst_when_dependsOnCommandInBatch(self):
+        registry = CommandRegistry({'update_dns': {'msg': {}}, 'public_ip': {'msg': {}},
+                                    'reset_reverse_ssh': {'msg': {}, 'depends_on': ['update_dns']}})
+
+        eq_(plan_batch([registry['reset_reverse_ssh'], registry['public_ip'], registry['update_dns']]), [[1, 2], [0]])
+
+    def test_should_ignoreDependency_when_notInBatch(self):
+        registry = CommandRegistry({'update_dns': {'msg': {}},
+                                    'reset_reverse_ssh': {'msg': {}, 'depends_on': ['update_dns']}})
+
+        eq_(plan_batch([registry['reset_reverse_ssh']]), [[0]])
@@ -0,0 +1,81 @@
+import asyncio
+import unittest
+
+from nose.tools import ok_, eq_
+
+from sms.commands import Command
+from sms.concurrency import CommandScheduler
+
+
+def command(key, concurrency='mutex', priority=0, mutex=None, builtin=None):
+    conf = {'msg': {}, 'concurrency': concurrency, 'priority': priority, 'builtin': builtin}
+    if mutex:
+        conf['mutex'] = mutex
+    return Command.from_config(key, conf)
+
+
+class TestCommandScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.scheduler = CommandScheduler()
+        self.events = []
+
+    def tearDown(self):
+        self.loop.close()
+
+    async def run_command(self, cmd, duration=0.05):
+        async with self.scheduler.slot(cmd):
+            self.events.append(('start', cmd.key))
+            await asyncio.sleep(duration)
+            self.events.append(('end', cmd.key))
+
+    def run_all(self, *coroutines):
+        self.loop.run_until_complete(asyncio.gather(*coroutines))
+
+    def test_should_overlap_when_commandsParallel(self):
+        self.run_all(self.run_command(command('a', 'parallel')), self.run_command(command('b', 'parallel')))
+
+        eq_(self.events, [('start', 'a'), ('start', 'b'), ('end', 'a'), ('end', 'b')])
+
+    def test_should_serialize_when_commandsShareMutex(self):
+        self.run_all(self.run_command(command('a', mutex='network')), self.run_command(command('b', mutex='network')),
+                     self.run_command(command('c', mutex='meter'), duration=0.2))
+
+        eq_(self.events, [('start', 'a'), ('start', 'c'), ('end', 'a'), ('start', 'b'), ('end', 'b'), ('end', 'c')])
+
+    def test_should_neverOverlap_when_commandExclusive(self):
+        self.run_all(self.run_command(command('a', 'parallel')), self.run_command(command('reboot', 'exclusive')),
+                     self.run_command(command('b', 'parallel')))
+
+        eq_(self.events, [('start', 'a'), ('end', 'a'), ('start', 'reboot'), ('end', 'reboot'),
+                          ('start', 'b'), ('end', 'b')])
+
+    def test_should_startHigherPriorityFirst_when_waiting(self):
+        self.run_all(self.run_command(command('exec', mutex='shell')),
+                     self.run_command(command('low', mutex='shell')),
+                     self.run_command(command('urgent', mutex='shell', priority=10)))
+
+        eq_([key for event, key in self.events if event == 'start'], ['exec', 'urgent', 'low'])
+
+    def test_should_notWait_when_commandBuiltin(self):
+        self.run_all(self.run_command(command('reboot', 'exclusive')),
+                     self.run_command(command('jobs', builtin='jobs'), duration=0))
+
+        eq_(self.events[:3], [('start', 'reboot'), ('start', 'jobs'), ('end', 'jobs')])
+
+    def test_should_releaseQueue_when_waitingCommandCancelled(self):
+        async def scenario():
+            first = asyncio.ensure_future(self.run_command(command('a', 'exclusive')))
+            await asyncio.sleep(0)
+            waiting = asyncio.ensure_future(self.run_command(command('b', 'exclusive')))
+            await asyncio.sleep(0)
+            waiting.cancel()
+            await first
+
+        self.loop.run_until_complete(scenario())
+
+        eq_(self.scheduler.running, 0)
+        eq_(self.scheduler.waiting, 0)
+        ok_(('start', 'b') not in self.events)
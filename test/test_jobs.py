@@ -0,0 +1,59 @@
+import unittest
+
+from nose.tools import ok_, eq_
+
+from sms.jobs import CANCELLED, DONE, FAILED, RUNNING, JobTable
+
+
+class TestJobTable(unittest.TestCase):
+
+    def test_should_returnNone_when_maxRunningReached(self):
+        table = JobTable(max_running=1)
+
+        ok_(table.start({'command': None}) is not None)
+        eq_(table.start({'command': None}), None)
+
+    def test_should_assignJobIdToSMS_when_started(self):
+        table = JobTable()
+        sms = {'command': None}
+
+        job = table.start(sms)
+
+        eq_(sms['job_id'], job.id)
+        eq_(job.state, RUNNING)
+        ok_(table.get(job.id) is job)
+
+    def test_should_reportFinishedJobsOnce(self):
+        table = JobTable()
+        done = table.start({'command': None})
+        failed = table.start({'command': None})
+
+        table.finish(done)
+        table.finish(failed, error=ValueError())
+
+        eq_([job.state for job in table.take_finished()], [DONE, FAILED])
+        eq_(table.take_finished(), [])
+        eq_(len(table), 0)
+
+    def test_should_keepCancelledState_when_cancelledJobFinishes(self):
+        table = JobTable()
+        job = table.start({'command': None})
+
+        ok_(table.cancel(job.id) is job)
+        eq_(table.cancel(job.id), None)
+        table.finish(job, error=ValueError())
+
+        eq_(job.state, CANCELLED)
+        eq_(job.error, None)
+
+    def test_should_evictLeastRecentlyUsed_when_maxFinishedReached(self):
+        table = JobTable(max_finished=2)
+        jobs = [table.start({'command': None}) for _ in range(2)]
+        for job in jobs:
+            table.finish(job)
+        table.get(jobs[0].id)
+
+        table.finish(table.start({'command': None}))
+
+        ok_(table.get(jobs[0].id) is jobs[0])
+        eq_(table.get(jobs[1].id), None)
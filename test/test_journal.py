@@ -0,0 +1,72 @@
+import shutil
+import tempfile
+import unittest
+from os import path
+
+from nose.tools import ok_, eq_
+
+from sms.journal import RECEIVED, STARTED, SMSJournal
+
+
+class TestSMSJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = path.join(self.dir, 'journal.log')
+        self.messages = [{'id': i, 'number': '+34666666666', 'content': 'public_ip', 'date': '18,10,17,10,30,0%s' % i}
+                         for i in range(3)]
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def count_lines(self):
+        with open(self.path) as f:
+            return len(f.readlines())
+
+    def test_should_detectDuplicated_when_smsAlreadyReceived(self):
+        journal = SMSJournal(self.path)
+        journal.received(self.messages[:1])
+
+        ok_(journal.seen(dict(self.messages[0])))
+        ok_(not journal.seen(self.messages[1]))
+        ok_(not journal.seen(dict(self.messages[0], content='update_dns')))
+
+    def test_should_returnUnfinished_when_reopenedAfterCrash(self):
+        journal = SMSJournal(self.path)
+        journal.received(self.messages)
+        journal.started(self.messages[1])
+        journal.done(self.messages[2])
+        journal.sync()
+
+        unfinished = SMSJournal(self.path).unfinished()
+
+        eq_([(state, sms['id']) for state, sms in unfinished], [(RECEIVED, 0), (STARTED, 1)])
+        eq_(unfinished[0][1], self.messages[0])
+
+    def test_should_ignoreTornLine_when_loading(self):
+        journal = SMSJournal(self.path)
+        journal.received(self.messages[:1])
+        journal.close()
+        with open(self.path, 'a') as f:
+            f.write('{"k":"1:')
+
+        eq_(len(SMSJournal(self.path)), 1)
+
+    def test_should_boundFileSize_when_manyMessagesProcessed(self):
+        journal = SMSJournal(self.path, max_entries=10, sync_batch=4)
+        for i in range(100):
+            sms = {'id': i, 'number': '+34666666666', 'content': 'public_ip'}
+            journal.received([sms])
+            journal.started(sms)
+            journal.done(sms)
+        journal.close()
+
+        ok_(self.count_lines() <= 20)
+        journal = SMSJournal(self.path, max_entries=10)
+        eq_(len(journal), 10)
+        ok_(journal.seen({'id': 99, 'number': '+34666666666', 'content': 'public_ip'}))
+        eq_(journal.unfinished(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
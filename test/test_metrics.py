@@ -0,0 +1,84 @@
+import shutil
+import tempfile
+import unittest
+from os import path
+from urllib.request import urlopen
+
+from nose.tools import ok_, eq_
+
+from sms.metrics import Counter, Gauge, Histogram, Metrics, MetricsExporter
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_should_renderCounter_when_incremented(self):
+        counter = Counter('sms_modem_errors_total', 'Failed requests', labels=('operation',))
+        counter.inc('send')
+        counter.inc('send')
+
+        eq_(counter.render(), ['# HELP sms_modem_errors_total Failed requests',
+                               '# TYPE sms_modem_errors_total counter',
+                               'sms_modem_errors_total{operation="send"} 2'])
+
+    def test_should_renderLastValue_when_gaugeSet(self):
+        gauge = Gauge('sms_outbox_pending', 'SMS waiting in the outbox')
+        gauge.set(3)
+        gauge.set(1)
+
+        eq_(gauge.render(), ['# HELP sms_outbox_pending SMS waiting in the outbox',
+                             '# TYPE sms_outbox_pending gauge',
+                             'sms_outbox_pending 1'])
+
+    def test_should_renderCumulativeBuckets_when_observed(self):
+        histogram = Histogram('sms_command_duration_seconds', 'Duration', labels=('command',), buckets=(0.1, 1))
+        histogram.observe(0.05, 'public_ip')
+        histogram.observe(0.5, 'public_ip')
+        histogram.observe(5, 'public_ip')
+
+        lines = histogram.render()
+        ok_('sms_command_duration_seconds_bucket{command="public_ip",le="0.1"} 1' in lines)
+        ok_('sms_command_duration_seconds_bucket{command="public_ip",le="1"} 2' in lines)
+        ok_('sms_command_duration_seconds_bucket{command="public_ip",le="+Inf"} 3' in lines)
+        ok_('sms_command_duration_seconds_count{command="public_ip"} 3' in lines)
+
+    def test_should_countModemError_when_operationFails(self):
+        metrics = Metrics()
+        with self.assertRaises(IOError):
+            with metrics.modem('inbox'):
+                raise IOError()
+
+        eq_(metrics.modem_errors.get('inbox'), 1)
+        eq_(metrics.stage_duration.count('inbox'), 1)
+
+
+class TestMetricsExporter(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.metrics = Metrics()
+        self.metrics.received.inc(value=3)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_should_serveMetrics_when_portConfigured(self):
+        exporter = MetricsExporter(self.metrics, port=0)
+        exporter.start()
+        try:
+            port = exporter._server.server_address[1]
+            body = urlopen('http://127.0.0.1:%s/metrics' % port).read().decode('utf-8')
+        finally:
+            exporter.stop()
+
+        ok_('sms_received_total 3' in body)
+
+    def test_should_writeTextfile_when_textfileConfigured(self):
+        textfile = path.join(self.dir, 'sms_cmd.prom')
+        MetricsExporter(self.metrics, textfile=textfile).write_textfile()
+
+        with open(textfile) as f:
+            ok_('sms_received_total 3' in f.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+import unittest
+from unittest.mock import MagicMock
+
+from nose.tools import ok_, eq_
+
+from sms.modem import ModemPool, UnreadInbox, ZTEModemClient, encode_ucs2, decode_ucs2, modem_from_config
+from sms.simulator import ModemSimulator
+
+
+class TestUnreadInbox(unittest.TestCase):
+
+    def setUp(self):
+        self.messages = [{'id': 1, 'number': '+34666666666', 'content': 'public_ip'},
+                         {'id': 2, 'number': '+34666666666', 'content': 'update_dns'}]
+
+    def test_should_notFetchInbox_when_unreadCountIsZero(self):
+        fetch = MagicMock(return_value=[])
+        inbox = UnreadInbox(count=MagicMock(return_value=0), fetch=fetch, ttl=0)
+
+        eq_(inbox.unread(), [])
+        eq_(fetch.call_count, 0)
+
+    def test_should_fetchInboxOnce_when_calledInsideTTL(self):
+        fetch = MagicMock(return_value=self.messages)
+        inbox = UnreadInbox(count=MagicMock(return_value=2), fetch=fetch, ttl=60)
+
+        eq_(inbox.unread(), self.messages)
+        eq_(inbox.unread(), self.messages)
+        eq_(fetch.call_count, 1)
+
+    def test_should_fetchInbox_when_probeFails(self):
+        fetch = MagicMock(return_value=self.messages)
+        inbox = UnreadInbox(count=MagicMock(side_effect=IOError), fetch=fetch, ttl=0)
+
+        eq_(inbox.unread(), self.messages)
+
+    def test_should_removeFromCache_when_smsDeleted(self):
+        inbox = UnreadInbox(count=MagicMock(return_value=2), fetch=MagicMock(return_value=self.messages), ttl=60)
+        inbox.unread()
+        inbox.discard(1)
+
+        eq_([sms['id'] for sms in inbox.unread()], [2])
+
+
+class TestZTEModemClient(unittest.TestCase):
+
+    def setUp(self):
+        self.client = ZTEModemClient(url='http://modem', cache_ttl=0)
+        self.client._session = MagicMock()
+        self.client._session.post.return_value.json.return_value = {'result': 'success'}
+
+    def test_should_decodeMessages_when_fetchUnread(self):
+        self.client._session.get.return_value.json.side_effect = [
+            {'sms_received_flag': '1', 'sms_unread_num': '1'},
+            {'messages': [{'id': '7', 'number': '+34666666666', 'content': encode_ucs2('public_ip'), 'tag': '1',
+                           'date': '18,10,17,10,30,00,+4'}]}]
+
+        eq_(self.client.sms_unread(), [{'id': '7', 'number': '+34666666666', 'content': 'public_ip',
+                                        'date': '18,10,17,10,30,00,+4'}])
+
+    def test_should_deleteAllIdsInOneRequest_when_deleteSMS(self):
+        self.client.delete_sms(['1', '2', '3'])
+
+        eq_(self.client._session.post.call_count, 1)
+        eq_(self.client._session.post.call_args[1]['data']['msg_id'], '1;2;3;')
+
+    def test_should_sendOnceForSeveralPhones_when_sameMessageQueued(self):
+        self.client.queue_sms('+34666666666', 'Unauthorized phone number 5020')
+        self.client.queue_sms('+34666666667', 'Unauthorized phone number 5020')
+        self.client.queue_sms('+34666666666', 'Public IP: 127.0.0.1')
+
+        eq_(self.client._session.post.call_count, 0)
+        self.client.flush_sms()
+
+        eq_(self.client._session.post.call_count, 2)
+        data = [c[1]['data'] for c in self.client._session.post.call_args_list]
+        eq_(data[0]['Number'], '+34666666666;+34666666667')
+        eq_(decode_ucs2(data[1]['MessageBody']), 'Public IP: 127.0.0.1')
+
+    def test_should_keepQueuedSMS_when_sendFails(self):
+        self.client._session.post.return_value.json.return_value = {'result': 'failure'}
+        self.client.queue_sms('+34666666666', 'DNS updated')
+
+        self.assertRaises(IOError, self.client.flush_sms)
+        eq_(len(self.client.outbound), 1)
+
+
+
+class TestModemPool(unittest.TestCase):
+
+    def setUp(self):
+        self.simulators = [ModemSimulator().start(), ModemSimulator().start()]
+        self.pool = ModemPool([ZTEModemClient(url=simulator.url, cache_ttl=0) for simulator in self.simulators],
+                              names=['primary', 'backup'], retry_interval=60)
+
+    def tearDown(self):
+        self.pool.close()
+        for simulator in self.simulators:
+            simulator.stop()
+
+    def test_should_mergeInboxesAndDeleteCopies_when_sameSMSInBothModems(self):
+        for simulator in self.simulators:
+            simulator.state.inject('+34666666666', 'public_ip')
+        self.simulators[1].state.inject('+34666666666', 'update_dns')
+
+        messages = self.pool.sms_unread()
+
+        eq_(sorted((sms['id'], sms['content']) for sms in messages),
+            [('backup/2', 'update_dns'), ('primary/1', 'public_ip')])
+        eq_(len(self.simulators[1].state.unread()), 1)
+        self.pool.delete_sms([sms['id'] for sms in messages])
+        eq_([simulator.state.unread() for simulator in self.simulators], [[], []])
+
+    def test_should_readOtherModems_when_oneFails(self):
+        self.simulators[0].state.error_rate = 1
+        self.simulators[1].state.inject('+34666666666', 'public_ip')
+
+        eq_([sms['id'] for sms in self.pool.sms_unread()], ['backup/1'])
+        eq_(self.pool.available(), [1])
+
+    def test_should_spreadOutboundByLatency(self):
+        self.pool.modems[0].send_latency = 0.1
+        self.pool.modems[1].send_latency = 0.3
+        for n in range(4):
+            self.pool.queue_sms('+34666666666', 'reply %s' % n)
+
+        eq_([len(modem.outbound) for modem in self.pool.modems], [3, 1])
+
+    def test_should_failoverQueuedSMS_when_sendFails(self):
+        self.simulators[0].state.error_rate = 1
+        self.pool.queue_sms('+34666666666', 'DNS updated')
+        self.pool.queue_sms('+34666666667', 'Public IP: 127.0.0.1')
+
+        self.pool.flush_sms()
+
+        eq_(self.simulators[0].state.sent, [])
+        eq_(sorted((number, text) for _, number, text in self.simulators[1].state.sent),
+            [('+34666666666', 'DNS updated'), ('+34666666667', 'Public IP: 127.0.0.1')])
+        eq_(self.pool.available(), [1])
+
+    def test_should_keepKeys_when_queuedSMSFailover(self):
+        self.simulators[0].state.error_rate = 1
+        sent = []
+        self.pool.set_on_sent(sent.extend)
+        self.pool.modems[0].queue_sms('+34666666666', 'DNS updated', 'a')
+        self.pool.modems[0].queue_sms('+34666666667', 'DNS updated', 'b')
+
+        self.pool.flush_sms()
+
+        eq_(sent, ['a', 'b'])
+
+    def test_should_keepQueuedSMS_when_allModemsFail(self):
+        for simulator in self.simulators:
+            simulator.state.error_rate = 1
+        self.pool.queue_sms('+34666666666', 'DNS updated')
+
+        self.assertRaises(IOError, self.pool.flush_sms)
+        eq_(sum(len(modem.outbound) for modem in self.pool.modems), 1)
+        self.pool.clear_sms()
+        eq_(sum(len(modem.outbound) for modem in self.pool.modems), 0)
+
+
+class TestModemFromConfig(unittest.TestCase):
+
+    def test_should_buildSingleClient_when_legacyModemSection(self):
+        ok_(isinstance(modem_from_config({'modem': {'url': 'http://modem'}}), ZTEModemClient))
+
+    def test_should_buildPool_when_modemsList(self):
+        pool = modem_from_config({'modems': [{'name': 'primary', 'url': 'http://a'}, {'url': 'http://b'}],
+                                  'modem_pool': {'dedup_window': 60}})
+
+        eq_(pool.names, ['primary', '1'])
+        eq_(pool.dedup_window, 60)
+        pool.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+from unittest.mock import MagicMock, call
+
+from nose.tools import ok_, eq_
+
+from sms.outbound import GSM7, UCS2, OutboundQueue, build_message, encoding, fit, split_segments
+
+
+class TestSegmentation(unittest.TestCase):
+
+    def test_should_detectEncoding_when_textHasNonGSM7Chars(self):
+        eq_(encoding('Public IP: 127.0.0.1 {ok}'), GSM7)
+        eq_(encoding('Temperatura 20ºC'), UCS2)
+
+    def test_should_returnOneSegment_when_textFitsInSingleSMS(self):
+        eq_(split_segments('a' * 160), ['a' * 160])
+        eq_(split_segments('ñ' * 70 + 'º'), ['ñ' * 67, 'ñ' * 3 + 'º'])
+
+    def test_should_splitIn153Septets_when_textIsLongGSM7(self):
+        segments = split_segments('a' * 400)
+
+        eq_([len(s) for s in segments], [153, 153, 94])
+
+    def test_should_notSplitEscapedChar_when_extendedCharAtBoundary(self):
+        segments = split_segments('a' * 152 + '€' + 'a' * 10)
+
+        eq_(segments[0], 'a' * 152)
+        ok_(segments[1].startswith('€'))
+
+    def test_should_keepBeginning_when_truncateHead(self):
+        text = fit('a' * 200 + 'b' * 200, max_segments=2, truncate='head')
+
+        eq_(len(split_segments(text)), 2)
+        ok_(text.startswith('a' * 200))
+        ok_(text.endswith('...'))
+
+    def test_should_keepEnd_when_truncateTail(self):
+        text = fit('a' * 200 + 'b' * 200, max_segments=1, truncate='tail')
+
+        eq_(text, '...' + 'b' * 157)
+
+    def test_should_countSegments_when_buildMessage(self):
+        message = build_message('º' * 500, max_segments=3)
+
+        eq_(message.encoding, UCS2)
+        eq_(message.segments, 3)
+
+
+class TestOutboundQueue(unittest.TestCase):
+
+    def test_should_sendOnceForSeveralPhones_when_sameMessageQueued(self):
+        send = MagicMock()
+        queue = OutboundQueue(send=send)
+        queue.put('+34666666666', 'Unauthorized phone number 5020')
+        queue.put('+34666666667', 'Unauthorized phone number 5020')
+        queue.put('+34666666666', 'Unauthorized phone number 5020')
+        queue.drain()
+
+        eq_([c[0][0] for c in send.call_args_list], [['+34666666666', '+34666666667'], ['+34666666666']])
+        eq_(len(queue), 0)
+
+    def test_should_stopDraining_when_rateLimitReached(self):
+        send = MagicMock()
+        queue = OutboundQueue(send=send, segments_per_minute=1)
+        queue.put('+34666666666', 'DNS updated')
+        queue.put('+34666666666', 'Public IP: 127.0.0.1')
+
+        delay = queue.drain(wait=False)
+
+        eq_(send.call_count, 1)
+        eq_(len(queue), 1)
+        ok_(55 < delay <= 60)
+
+    def test_should_reportSentKeys_when_messageSent(self):
+        on_sent = MagicMock()
+        queue = OutboundQueue(send=MagicMock(side_effect=[None, IOError("Modem unreachable")]), on_sent=on_sent)
+        queue.put('+34666666666', 'Unauthorized phone number 5020', 'a')
+        queue.put('+34666666667', 'Unauthorized phone number 5020')
+        queue.put('+34666666666', 'DNS updated', 'b')
+
+        self.assertRaises(IOError, queue.drain)
+
+        eq_(on_sent.call_args_list, [call(['a'])])
+        eq_([keys for _, _, keys in queue.take()], [['b']])
+
+    def test_should_throwValueError_when_unknownTruncatePolicy(self):
+        self.assertRaises(ValueError, OutboundQueue, MagicMock(), truncate='middle')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from nose.tools import ok_, eq_
+
+from sms.outbox import Outbox
+
+
+class TestOutbox(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'outbox.db')
+        self.outbox = Outbox(self.path, base_delay=10, max_delay=25, batch=2)
+
+    def tearDown(self):
+        self.outbox.close()
+        shutil.rmtree(self.dir)
+
+    def reopen(self):
+        self.outbox.close()
+        self.outbox = Outbox(self.path, base_delay=10, max_delay=25, batch=2)
+
+    def test_should_absorbSMS_when_samePhoneAndTextPending(self):
+        key = self.outbox.put('+34666666666', 'DNS updated')
+
+        eq_(self.outbox.put('+34666666666', 'DNS updated'), None)
+        ok_(self.outbox.put('+34666666667', 'DNS updated') is not None)
+        eq_(len(self.outbox), 2)
+
+        self.outbox.due()
+        self.outbox.sent([key])
+        ok_(self.outbox.put('+34666666666', 'DNS updated') is not None)
+
+    def test_should_returnOldestInBatches_when_due(self):
+        for n in range(3):
+            self.outbox.put('+34666666666', 'reply %s' % n)
+
+        eq_([text for _, _, text in self.outbox.due()], ['reply 0', 'reply 1'])
+        eq_([text for _, _, text in self.outbox.due()], ['reply 2'])
+        eq_(self.outbox.due(), [])
+
+    def test_should_keepSMS_when_committedAndReopened(self):
+        self.outbox.put('+34666666666', 'DNS updated')
+        self.outbox.commit()
+        self.reopen()
+
+        eq_([(phone, text) for _, phone, text in self.outbox.due()], [('+34666666666', 'DNS updated')])
+
+    def test_should_doubleDelayUpToMax_when_sendFailsAgain(self):
+        self.outbox.put('+34666666666', 'DNS updated')
+
+        delays = []
+        for _ in range(3):
+            self.outbox.due()
+            delays.append(round(self.outbox.failed()))
+            self.outbox._db.execute("UPDATE outbox SET next_attempt = ?", (time.time(),))
+
+        eq_(delays, [10, 20, 25])
+
+    def test_should_notReturnSMS_when_waitingRetry(self):
+        self.outbox.put('+34666666666', 'DNS updated')
+        self.outbox.due()
+        self.outbox.failed()
+
+        eq_(self.outbox.due(), [])
+        ok_(self.outbox.describe().startswith("Outbox: 1 pending, oldest 0s, 1 failed attempts, retry in"))
+
+    def test_should_releaseDelayedSMS_when_sendSucceeds(self):
+        delayed = self.outbox.put('+34666666666', 'DNS updated')
+        self.outbox.due()
+        self.outbox.failed()
+        key = self.outbox.put('+34666666666', 'Public IP: 127.0.0.1')
+
+        eq_([row[0] for row in self.outbox.due()], [key])
+        self.outbox.sent([key])
+
+        eq_([row[0] for row in self.outbox.due()], [delayed])
+        eq_(self.outbox.retry_in(), 0)
+        eq_(len(self.outbox), 1)
+
+    def test_should_describeEmpty_when_nothingPending(self):
+        eq_(self.outbox.describe(), "Outbox empty")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+
+from nose.tools import ok_, eq_
+
+from sms.phones import ALL_COMMANDS, PhoneAccess, PhoneNumbering
+
+
+class TestPhoneNumbering(unittest.TestCase):
+
+    def setUp(self):
+        self.numbering = PhoneNumbering(country_code='+34', national_digits=9)
+
+    def test_should_returnE164_when_sameNumberInSeveralForms(self):
+        for number in ('+34666666666', '0034666666666', '34666666666', '666666666', '+34 666 66 66 66',
+                       '666-666-666'):
+            eq_(self.numbering.normalize(number), '+34666666666')
+
+    def test_should_keepShortCode_when_fewDigits(self):
+        eq_(self.numbering.normalize('5087'), '5087')
+        eq_(self.numbering.normalize(5087), '5087')
+
+    def test_should_keepNumber_when_notNationalNorInternational(self):
+        eq_(self.numbering.normalize('12345678'), '12345678')
+        eq_(self.numbering.normalize('Movistar'), 'Movistar')
+
+    def test_should_notAddCountryCode_when_noCountryConfigured(self):
+        eq_(PhoneNumbering().normalize('666666666'), '666666666')
+        eq_(PhoneNumbering().normalize('0034666666666'), '+34666666666')
+
+
+class TestPhoneAccess(unittest.TestCase):
+
+    def setUp(self):
+        self.access = PhoneAccess(authorized=['+34666666666', '5087'],
+                                  groups={'operators': {'phones': ['666666667', '+34666666668'],
+                                                        'commands': ['public_ip', 'status']},
+                                          'dns': {'phones': ['0034666666667'], 'commands': ['update_dns']},
+                                          'admins': {'phones': ['+34666666669'], 'commands': '*'}},
+                                  numbering=PhoneNumbering(country_code='34', national_digits=9))
+
+    def test_should_allowEveryCommand_when_phoneAuthorized(self):
+        ok_(self.access.allowed('0034666666666') is ALL_COMMANDS)
+        ok_(self.access.allowed('5087') is ALL_COMMANDS)
+        ok_(self.access.allowed('+34666666669') is ALL_COMMANDS)
+        ok_('exec' in self.access.allowed('+34666666666'))
+
+    def test_should_mergeGroupCommands_when_phoneInSeveralGroups(self):
+        eq_(self.access.allowed('+34666666667'), frozenset(['public_ip', 'status', 'update_dns']))
+        eq_(self.access.allowed('666666668'), frozenset(['public_ip', 'status']))
+
+    def test_should_returnNone_when_phoneNotAuthorized(self):
+        eq_(self.access.allowed('+34666666670'), None)
+        eq_(self.access.allowed('3217'), None)
+
+    def test_should_listGroupCommands_when_groupsConfigured(self):
+        eq_(self.access.commands(), {'public_ip', 'status', 'update_dns'})
+        eq_(len(self.access.phones), 5)
+
+    def test_should_throwValueError_when_groupWithoutCommands(self):
+        self.assertRaises(ValueError, PhoneAccess, groups={'empty': {'phones': ['+34666666667']}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import asyncio
+import os
+import time
+import unittest
+from subprocess import CalledProcessError, TimeoutExpired
+
+from nose.tools import ok_, eq_
+
+from sms.process import POSIX_SPAWN, SUBPROCESS, OutputBuffer, capture_output, capture_output_async, \
+    resolve_spawn_backend
+
+
+class TestOutputBuffer(unittest.TestCase):
+
+    def test_should_keepAllBytes_when_outputUnderLimit(self):
+        buffer = OutputBuffer.from_bytes(b'hola\n', limit=10)
+
+        eq_(buffer.getvalue(), b'hola\n')
+        eq_(buffer.total, 5)
+        eq_(buffer.truncated, 0)
+
+    def test_should_keepHeadAndTail_when_outputOverLimit(self):
+        buffer = OutputBuffer(limit=8)
+        for chunk in (b'abc', b'defghij', b'klmnop', b'qrst'):
+            buffer.write(chunk)
+
+        eq_(buffer.getvalue(), b'abcd...qrst')
+        eq_(buffer.total, 20)
+        eq_(buffer.truncated, 12)
+
+
+class TestCaptureOutput(unittest.TestCase):
+    spawn = SUBPROCESS
+
+    def test_should_returnOutput_when_commandFinishOK(self):
+        eq_(capture_output('echo "hola"', spawn=self.spawn).getvalue(), b'hola\n')
+        eq_(capture_output(['echo', 'hola'], spawn=self.spawn).getvalue(), b'hola\n')
+
+    def test_should_throwCalledProcessError_when_commandFinishKO(self):
+        with self.assertRaises(CalledProcessError) as cm:
+            capture_output('echo "hola"; exit 3', spawn=self.spawn)
+
+        eq_(cm.exception.returncode, 3)
+        eq_(cm.exception.output, b'hola\n')
+
+    def test_should_killProcessGroup_when_timeoutExpired(self):
+        start = time.monotonic()
+        with self.assertRaises(TimeoutExpired):
+            capture_output('sleep 5 & sleep 5; wait', timeout=0.3, spawn=self.spawn)
+
+        ok_(time.monotonic() - start < 2)
+
+    def test_should_boundMemory_when_outputIsLarge(self):
+        output = capture_output('head -c 1000000 /dev/zero', limit=100, spawn=self.spawn)
+
+        eq_(len(output.getvalue()), 103)
+        eq_(output.total, 1000000)
+
+    def test_should_throwFileNotFoundError_when_listCommandNotExists(self):
+        self.assertRaises(FileNotFoundError, capture_output, ['no-such-command'], spawn=self.spawn)
+
+    def test_should_returnNegativeCode_when_killedBySignal(self):
+        with self.assertRaises(CalledProcessError) as cm:
+            capture_output('kill -9 $$', spawn=self.spawn)
+
+        eq_(cm.exception.returncode, -9)
+
+
+@unittest.skipUnless(hasattr(os, 'posix_spawnp'), "posix_spawn needs Python 3.8+")
+class TestCaptureOutputPosixSpawn(TestCaptureOutput):
+    spawn = POSIX_SPAWN
+
+
+class TestCaptureOutputAsync(unittest.TestCase):
+    spawn = SUBPROCESS
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_should_returnOutput_when_commandFinishOK(self):
+        for cmd in ('echo "hola"', ['echo', 'hola']):
+            eq_(self.loop.run_until_complete(capture_output_async(cmd, spawn=self.spawn)).getvalue(), b'hola\n')
+
+    def test_should_throwCalledProcessError_when_commandFinishKO(self):
+        with self.assertRaises(CalledProcessError) as cm:
+            self.loop.run_until_complete(capture_output_async('exit 2', spawn=self.spawn))
+
+        eq_(cm.exception.returncode, 2)
+
+    def test_should_runConcurrently_when_severalCommands(self):
+        start = time.monotonic()
+        self.loop.run_until_complete(asyncio.gather(*[capture_output_async('sleep 0.5', spawn=self.spawn)
+                                                      for _ in range(4)]))
+
+        ok_(time.monotonic() - start < 1.5)
+
+    def test_should_boundMemory_when_outputIsLarge(self):
+        output = self.loop.run_until_complete(capture_output_async('head -c 1000000 /dev/zero', limit=100,
+                                                                   spawn=self.spawn))
+
+        eq_(len(output.getvalue()), 103)
+        eq_(output.total, 1000000)
+        eq_(output.truncated, 999900)
+
+    def test_should_killProcessGroup_when_timeoutExpired(self):
+        start = time.monotonic()
+        with self.assertRaises(TimeoutExpired):
+            self.loop.run_until_complete(capture_output_async('sleep 5 & sleep 5; wait', timeout=0.3,
+                                                              spawn=self.spawn))
+
+        ok_(time.monotonic() - start < 2)
+
+
+@unittest.skipUnless(hasattr(os, 'posix_spawnp'), "posix_spawn needs Python 3.8+")
+class TestCaptureOutputAsyncPosixSpawn(TestCaptureOutputAsync):
+    spawn = POSIX_SPAWN
+
+
+class TestResolveSpawnBackend(unittest.TestCase):
+
+    def test_should_throwValueError_when_unknownBackend(self):
+        self.assertRaises(ValueError, resolve_spawn_backend, 'zygote')
+
+    def test_should_fallbackToSubprocess_when_posixSpawnNotAvailable(self):
+        expected = POSIX_SPAWN if hasattr(os, 'posix_spawnp') else SUBPROCESS
+
+        eq_(resolve_spawn_backend(POSIX_SPAWN), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
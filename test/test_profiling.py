@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from nose.tools import ok_, eq_
+
+from sms.profiling import Profiler
+
+
+def busy_loop():
+    return sum(i * i for i in range(20000))
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.profiler = Profiler(self.dir, top=3)
+
+    def tearDown(self):
+        if self.profiler.cpu_running:
+            self.profiler.toggle_cpu()
+        if self.profiler.memory_running:
+            self.profiler.toggle_memory()
+        shutil.rmtree(self.dir)
+
+    def test_should_dumpProfileAndReturnHotFunctions_when_cpuToggledTwice(self):
+        eq_(self.profiler.command('cpu'), "CPU profiling started")
+        busy_loop()
+        top = self.profiler.command('cpu')
+
+        eq_(len(top.splitlines()), 3)
+        ok_('genexpr' in top)
+        dumps = os.listdir(self.dir)
+        eq_(len(dumps), 1)
+        ok_(dumps[0].startswith('sms-cmd-cpu-') and dumps[0].endswith('.prof'))
+
+    def test_should_dumpSnapshotAndReturnAllocationSites_when_memoryToggledTwice(self):
+        eq_(self.profiler.command('mem'), "Memory tracing started")
+        data = [str(i) for i in range(10000)]
+        top = self.profiler.command('mem')
+
+        ok_('test_profiling.py' in top)
+        ok_(not self.profiler.memory_running)
+        ok_(os.listdir(self.dir)[0].endswith('.snapshot'))
+        del data
+
+    def test_should_returnLastResults_when_noArguments(self):
+        eq_(self.profiler.command(''), "CPU:\nNo CPU profile\nMEM:\nNo memory snapshot")
+
+    def test_should_removeOldestDumps_when_sizeCapExceeded(self):
+        for index in range(3):
+            with open(os.path.join(self.dir, 'sms-cmd-cpu-%s.prof' % index), 'wb') as f:
+                f.write(b'0' * 100)
+            os.utime(os.path.join(self.dir, 'sms-cmd-cpu-%s.prof' % index), (index, index))
+        self.profiler.max_bytes = 250
+
+        self.profiler.enforce_cap()
+
+        eq_(sorted(os.listdir(self.dir)), ['sms-cmd-cpu-1.prof', 'sms-cmd-cpu-2.prof'])
@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from nose.tools import ok_, eq_
+
+from sms.reload import ConfigReloader
+
+
+def load(path):
+    with open(path) as f:
+        return f.read()
+
+
+def compile(text):
+    if 'bad' in text:
+        raise ValueError("bad config")
+
+    return text.upper()
+
+
+class TestConfigReloader(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'sms.yaml')
+        self.write('phones')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, text):
+        with open(self.path, 'w') as f:
+            f.write(text)
+
+    def test_should_returnNone_when_noReloadRequested(self):
+        reloader = ConfigReloader(self.path, compile, load=load)
+
+        eq_(reloader.take(), None)
+
+    def test_should_returnCompiledConfigOnce_when_reloadRequested(self):
+        reloader = ConfigReloader(self.path, compile, load=load)
+
+        reloader.request()
+        reloader.wait(1)
+
+        eq_(reloader.take(), ('PHONES', None))
+        eq_(reloader.take(), None)
+
+    def test_should_returnError_when_configInvalid(self):
+        self.write('bad phones')
+        reloader = ConfigReloader(self.path, compile, load=load)
+
+        reloader.request()
+        reloader.wait(1)
+
+        compiled, error = reloader.take()
+        eq_(compiled, None)
+        ok_(isinstance(error, ValueError))
+
+    def test_should_reload_when_fileModifiedAndWatched(self):
+        reloader = ConfigReloader(self.path, compile, watch=True, load=load)
+        self.write('commands')
+        os.utime(self.path, (time.time() + 10, time.time() + 10))
+
+        eq_(reloader.take(), None)
+        reloader.wait(1)
+
+        eq_(reloader.take(), ('COMMANDS', None))
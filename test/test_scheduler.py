@@ -0,0 +1,33 @@
+import unittest
+
+from nose.tools import eq_
+
+from sms.scheduler import PollScheduler
+
+
+class TestPollScheduler(unittest.TestCase):
+
+    def test_should_backOffUntilMax_when_inboxIsEmpty(self):
+        scheduler = PollScheduler(min_interval=5, max_interval=60, decay=2)
+        scheduler.next_interval(received=1)
+
+        eq_([scheduler.next_interval() for _ in range(5)], [10, 20, 40, 60, 60])
+
+    def test_should_returnMin_when_receiveSMS(self):
+        scheduler = PollScheduler(min_interval=5, max_interval=60, decay=2)
+
+        eq_(scheduler.next_interval(), 60)
+        eq_(scheduler.next_interval(received=3), 5)
+
+    def test_should_useFixedTime_when_pollNotConfigured(self):
+        scheduler = PollScheduler.from_config({'time': 30})
+
+        eq_(scheduler.next_interval(received=1), 30)
+        eq_(scheduler.next_interval(), 30)
+
+    def test_should_throwValueError_when_minGreaterThanMax(self):
+        self.assertRaises(ValueError, PollScheduler, 10, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+
+from nose.tools import ok_, eq_
+
+from sms.modem import ZTEModemClient
+from sms.simulator import ModemSimulator
+
+
+class TestModemSimulator(unittest.TestCase):
+
+    def setUp(self):
+        self.simulator = ModemSimulator().start()
+        self.client = ZTEModemClient(url=self.simulator.url, cache_ttl=0)
+
+    def tearDown(self):
+        self.client.close()
+        self.simulator.stop()
+
+    def test_should_probeOnly_when_inboxIsEmpty(self):
+        eq_(self.client.sms_unread(), [])
+        eq_(self.simulator.state.requests, 1)
+
+    def test_should_receiveAndDeleteSMS_when_burstInjected(self):
+        self.simulator.state.burst('+34666666666', ['public_ip', 'update_dns', 'exec uptime'])
+
+        messages = self.client.sms_unread()
+        eq_([sms['content'] for sms in messages], ['public_ip', 'update_dns', 'exec uptime'])
+
+        self.client.delete_sms([sms['id'] for sms in messages])
+        eq_(self.simulator.state.unread(), [])
+        eq_(self.simulator.state.requests, 3)
+
+    def test_should_recordSentSMS_when_flushed(self):
+        self.client.queue_sms('+34666666666', 'Public IP: 127.0.0.1')
+        self.client.queue_sms('+34666666667', 'Public IP: 127.0.0.1')
+        self.client.flush_sms()
+
+        eq_([(number, text) for _, number, text in self.simulator.state.sent],
+            [('+34666666666', 'Public IP: 127.0.0.1'), ('+34666666667', 'Public IP: 127.0.0.1')])
+        eq_(self.simulator.state.requests, 1)
+
+    def test_should_raiseError_when_modemFails(self):
+        self.simulator.state.error_rate = 1
+
+        self.assertRaises(Exception, self.client.unread_count)
+        ok_(self.simulator.state.errors)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,29 +1,73 @@
+import os
+import shutil
+import tempfile
+import time
 import unittest
+from os import path
 from unittest.mock import patch, MagicMock, call
 from buoy.lib.utils.config import load_config
-from sms.sms_cmd import SMSCMDDaemon, UnrecognizedCommandException, UnauthorizedPhoneNumberException
+from sms.commands import Command, CommandRegistry, CommandResult
+from sms.journal import SMSJournal
+from sms.outbox import Outbox
+from sms.process import OutputBuffer
+from sms.profiling import Profiler
+from sms.sms_cmd import SMSCMDDaemon, JobLimitException, UnrecognizedCommandException, \
+    UnauthorizedPhoneNumberException
 
 from nose.tools import ok_, eq_
 
 config_file = "test/config/sms.yaml"
 
 
+class FakeModemClient(object):
+    def __init__(self, sms_received):
+        self.sms_received = sms_received
+        self.sms_queued = []
+        self.sms_flushed = []
+        self.keys_queued = []
+        self.send_errors = 0
+        self.on_sent = None
+
+    def sms_unread(self):
+        return self.sms_received.copy()
+
+    def delete_sms(self, ids):
+        self.sms_received = [sms for sms in self.sms_received if sms['id'] not in ids]
+
+    def queue_sms(self, phone, msg, key=None):
+        self.sms_queued.append((phone, msg))
+        self.keys_queued.append(key)
+
+    def flush_sms(self, wait=True):
+        if self.send_errors:
+            self.send_errors -= 1
+            raise IOError("Modem unreachable")
+
+        self.sms_flushed += self.sms_queued
+        if self.on_sent:
+            self.on_sent([key for key in self.keys_queued if key is not None])
+        self.clear_sms()
+        return 0
+
+    def clear_sms(self):
+        self.sms_queued = []
+        self.keys_queued = []
+
+    def set_on_sent(self, on_sent):
+        self.on_sent = on_sent
+
+
 class FakeSMSCMDDaemon(SMSCMDDaemon):
     def __init__(self, **kwargs):
-        SMSCMDDaemon.__init__(self, config=load_config(path_config=config_file))
-        self.sms_received = kwargs.pop('sms_received', [])
+        SMSCMDDaemon.__init__(self, config=load_config(path_config=config_file),
+                              modem=FakeModemClient(kwargs.pop('sms_received', [])),
+                              config_file=kwargs.pop('config_file', None))
         self._active = True
 
-    def get_sms_unread(self):
-        return self.sms_received.copy()
-
-    def delete_sms(self, sms_in):
-        for index, sms in enumerate(self.sms_received):
-            if sms['id'] == sms_in['id']:
-                self.sms_received.pop(index)
-                break
+    def delete_sms(self, messages):
+        SMSCMDDaemon.delete_sms(self, messages)
 
-        if not len(self.sms_received):
+        if not len(self.modem.sms_received):
             self._active = False
 
 
@@ -54,18 +98,18 @@ class SMSIntegrationBaseMDTests(unittest.TestCase):
 
 class SMSIntegrationSimulateCMDTests(SMSIntegrationBaseMDTests):
 
-    @patch('sms.sms_cmd.check_output')
-    def test_should_sendSMS_whenReceiveSMS(self, mock_check_output):
+    @patch('sms.sms_cmd.capture_output')
+    def test_should_sendSMS_whenReceiveSMS(self, mock_capture_output):
         sms_sended_expected = []
         executions = []
 
         for sms in self.sms_received:
             if 'execution' in sms:
-                executions.append(sms['execution'])
+                executions.append(OutputBuffer.from_bytes(sms['execution']))
             if 'sms_sent' in sms:
                 sms_sended_expected += sms['sms_sent']
 
-        mock_check_output.side_effect = executions
+        mock_capture_output.side_effect = executions
 
         sms_cli = FakeSMSCMDDaemon(sms_received=self.sms_received)
         sms_cli.time = 0.2
@@ -164,6 +208,383 @@ class TestAllSMSRunCMD(SMSIntegrationRunCMDTests):
                     ]
 
 
+class TestAsyncMode(unittest.TestCase):
+
+    def test_should_sendSMS_when_runInAsyncMode(self):
+        sms_cli = FakeSMSCMDDaemon(sms_received=[{'id': 1, 'number': '+34666666666', 'content': 'exec echo "hola"'}])
+        sms_cli.mode = 'async'
+        sms_cli.time = 0.2
+        sms_cli.send_sms = MagicMock(return_value=None)
+
+        sms_cli.run()
+
+        eq_(sms_cli.send_sms.call_args_list, [call('+34666666666', 'Executing command: echo "hola"'),
+                                              call('+34666666666', 'Command executed: hola\n')])
+
+    def test_should_sendError_when_commandTimeoutExpired(self):
+        sms_cli = FakeSMSCMDDaemon(sms_received=[{'id': 1, 'number': '+34666666666', 'content': 'exec sleep 5'}])
+        sms_cli.mode = 'async'
+        sms_cli.time = 0.2
+        config = load_config(path_config=config_file)
+        config['commands']['exec']['timeout'] = 0.5
+        sms_cli.commands = CommandRegistry(config['commands'])
+        sms_cli.send_sms = MagicMock(return_value=None)
+
+        sms_cli.run()
+
+        eq_(sms_cli.send_sms.call_args_list, [call('+34666666666', 'Executing command: sleep 5'),
+                                              call('+34666666666', 'ERROR: Timeout after 0.5s | CMD: sleep 5 | RC: None')])
+
+
+class TestConfirmGrace(unittest.TestCase):
+
+    def daemon(self, content, mode='sync'):
+        sms_cli = FakeSMSCMDDaemon(sms_received=[{'id': 1, 'number': '+34666666666', 'content': content}])
+        sms_cli.mode = mode
+        sms_cli.time = 0.2
+        sms_cli.confirm_grace = 0.5
+        sms_cli.send_sms = MagicMock(return_value=None)
+        return sms_cli
+
+    def test_should_sendOnlyFinished_when_commandEndsWithinGrace(self):
+        for mode in ('sync', 'async'):
+            sms_cli = self.daemon('exec echo "hola"', mode=mode)
+
+            sms_cli.run()
+
+            eq_(sms_cli.send_sms.call_args_list, [call('+34666666666', 'Command executed: hola\n')])
+            eq_(sms_cli.collapsed_confirms.get(), 1)
+
+    def test_should_sendStartedAndFinished_when_commandOutlastsGrace(self):
+        for mode in ('sync', 'async'):
+            sms_cli = self.daemon('exec sleep 1; echo "hola"', mode=mode)
+
+            sms_cli.run()
+
+            eq_(sms_cli.send_sms.call_args_list, [call('+34666666666', 'Executing command: sleep 1; echo "hola"'),
+                                                  call('+34666666666', 'Command executed: hola\n')])
+            eq_(sms_cli.collapsed_confirms.get(), 0)
+
+    def test_should_replyErrorToSender_when_commandFailsWithinGrace(self):
+        sms_cli = self.daemon('exec exit 1')
+
+        sms_cli.run()
+
+        eq_(sms_cli.send_sms.call_args_list, [call('+34666666666', 'Error executing command: exit 1'),
+                                              call('+34666666666', 'ERROR: None | CMD: exit 1 | RC: 1')])
+
+
+class TestBackgroundJobs(unittest.TestCase):
+
+    def daemon(self):
+        sms_cli = FakeSMSCMDDaemon()
+        config = load_config(path_config=config_file)
+        config['commands']['slow_job'] = {'msg': {'started': 'Slow job', 'finished': 'Slow job done'},
+                                          'cli': 'sleep 5', 'background': True}
+        sms_cli.commands = CommandRegistry(config['commands'])
+        sms_cli.send_sms = MagicMock(return_value=None)
+        return sms_cli
+
+    def start_job(self, sms_cli, content):
+        sms = {'id': 1, 'number': '+34666666666', 'content': content, 'command': sms_cli.get_command(content)}
+        sms_cli.start_job(sms)
+        return sms['job_id']
+
+    @staticmethod
+    def wait_jobs(sms_cli):
+        for _ in range(50):
+            if not len(sms_cli.jobs):
+                return
+            time.sleep(0.1)
+
+    def test_should_replyJobIdAndNotifyResult_when_backgroundCommand(self):
+        sms_cli = self.daemon()
+
+        job_id = self.start_job(sms_cli, 'collect_logs')
+        self.wait_jobs(sms_cli)
+        sms_cli.notify_jobs()
+
+        eq_(sms_cli.send_sms.call_args_list, [call('+34666666666', 'Collecting logs (job %s)' % job_id),
+                                              call('+34666666666', 'Logs collected: logs\n (job %s)' % job_id)])
+        ok_(sms_cli.run_builtin(sms_cli.get_command('status ' + job_id)).getvalue().startswith(
+            (job_id + ' collect_logs done').encode()))
+
+    def test_should_killJob_when_cancelCommandReceived(self):
+        sms_cli = self.daemon()
+
+        job_id = self.start_job(sms_cli, 'slow_job')
+        time.sleep(0.2)
+        ok_(sms_cli.run_builtin(sms_cli.get_command('jobs')).getvalue().startswith(
+            (job_id + ' slow_job running').encode()))
+        eq_(sms_cli.run_builtin(sms_cli.get_command('cancel ' + job_id)).getvalue(),
+            ('Job %s cancelled' % job_id).encode())
+        self.wait_jobs(sms_cli)
+        sms_cli.notify_jobs()
+
+        eq_(len(sms_cli.jobs), 0)
+        eq_(sms_cli.jobs.get(job_id).state, 'cancelled')
+        eq_(sms_cli.send_sms.call_args_list, [call('+34666666666', 'Slow job (job %s)' % job_id)])
+
+    def test_should_rejectJob_when_tooManyRunning(self):
+        sms_cli = self.daemon()
+        sms_cli.jobs.max_running = 1
+
+        self.start_job(sms_cli, 'slow_job')
+
+        self.assertRaises(JobLimitException, self.start_job, sms_cli, 'slow_job')
+        sms_cli.jobs.cancel_all()
+
+
+class TestPriority(unittest.TestCase):
+
+    def test_should_runHigherPriorityFirst_when_severalSMSPending(self):
+        sms_cli = FakeSMSCMDDaemon(sms_received=[{'id': 1, 'number': '+34666666666', 'content': 'exec echo "1"'},
+                                                 {'id': 2, 'number': '+34666666666', 'content': 'urgent'}])
+        config = load_config(path_config=config_file)
+        config['commands']['urgent'] = {'msg': {'started': 'Urgent'}, 'cli': 'true', 'priority': 10}
+        sms_cli.commands = CommandRegistry(config['commands'])
+        sms_cli.send_sms = MagicMock(return_value=None)
+
+        sms_cli.run()
+
+        eq_(sms_cli.send_sms.call_args_list, [call('+34666666666', 'Urgent'),
+                                              call('+34666666666', 'Executing command: echo "1"'),
+                                              call('+34666666666', 'Command executed: 1\n')])
+
+
+class TestBatch(unittest.TestCase):
+
+    def daemon(self, content, mode='sync'):
+        sms_cli = FakeSMSCMDDaemon(sms_received=[{'id': 1, 'number': '+34666666666', 'content': content}])
+        sms_cli.mode = mode
+        sms_cli.time = 0.2
+        config = load_config(path_config=config_file)
+        config['commands'].update({
+            'hello': {'msg': {'started': 'Saying hello', 'finished': 'Hello: {command_output}'}, 'cli': 'echo hi'},
+            'fail': {'msg': {'started': 'Failing', 'error': 'Error failing'}, 'cli': 'exit 1'},
+            'after_fail': {'msg': {'started': 'After fail'}, 'cli': 'echo after', 'depends_on': ['fail']},
+            'quiet': {'msg': {'started': 'Quiet'}, 'cli': 'true'}})
+        sms_cli.commands = CommandRegistry(config['commands'])
+        sms_cli.send_sms = MagicMock(return_value=None)
+        return sms_cli
+
+    def test_should_sendOneReply_when_smsHasSeveralCommands(self):
+        sms_cli = self.daemon('hello; quiet; exec echo a; echo b')
+
+        sms_cli.run()
+
+        eq_(sms_cli.send_sms.call_args_list, [call('+34666666666', 'Hello: hi\n\nquiet: done\n'
+                                                                   'Command executed: a\nb\n')])
+
+    def test_should_skipDependents_when_dependencyFails(self):
+        sms_cli = self.daemon('after_fail; fail; hello', mode='async')
+
+        sms_cli.run()
+
+        eq_(sms_cli.send_sms.call_args_list, [
+            call('+34666666666', 'ERROR: None | CMD: exit 1 | RC: 1'),
+            call('+34666666666', 'after_fail: skipped, fail failed\nError failing\nHello: hi\n')])
+
+    def test_should_sendError_when_batchHasUnrecognizedCommand(self):
+        sms_cli = self.daemon('hello; connect_vpn')
+
+        sms_cli.run()
+
+        eq_(sms_cli.send_sms.call_args_list, [call('+34666666666',
+                                                   'Unrecognized command connect_vpn sent from +34666666666')])
+
+
+class TestJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.journal_file = path.join(self.dir, 'journal.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_should_resumeReceivedAndReportStarted_when_restarted(self):
+        journal = SMSJournal(self.journal_file)
+        received = {'id': 1, 'number': '+34666666666', 'content': 'exec echo "hola"'}
+        started = {'id': 2, 'number': '+34666666666', 'content': 'reboot_computer'}
+        journal.received([received, started])
+        journal.started(started)
+        journal.close()
+
+        sms_cli = FakeSMSCMDDaemon(sms_received=[{'id': 3, 'number': '+34666666666', 'content': 'connect_vpn'}])
+        sms_cli.journal = SMSJournal(self.journal_file)
+        sms_cli.send_sms = MagicMock(return_value=None)
+
+        sms_cli.run()
+
+        eq_(sms_cli.send_sms.call_args_list, [
+            call('+34666666666', 'Command reboot_computer sent from +34666666666 interrupted by restart'),
+            call('+34666666666', 'Executing command: echo "hola"'),
+            call('+34666666666', 'Command executed: hola\n'),
+            call('+34666666666', 'Unrecognized command connect_vpn sent from +34666666666')])
+        eq_(SMSJournal(self.journal_file).unfinished(), [])
+
+    def test_should_journalSMS_when_journalEmpty(self):
+        sms = {'id': 1, 'number': '+34666666666', 'content': 'exec echo "hola"'}
+        sms_cli = FakeSMSCMDDaemon(sms_received=[dict(sms)])
+        sms_cli.journal = SMSJournal(self.journal_file)
+        sms_cli.send_sms = MagicMock(return_value=None)
+
+        sms_cli.run()
+
+        ok_(SMSJournal(self.journal_file).seen(sms))
+
+    def test_should_skipSMS_when_alreadyInJournal(self):
+        sms = {'id': 1, 'number': '+34666666666', 'content': 'connect_vpn'}
+        journal = SMSJournal(self.journal_file)
+        journal.received([sms])
+        journal.done(sms)
+        journal.close()
+
+        sms_cli = FakeSMSCMDDaemon(sms_received=[dict(sms)])
+        sms_cli.journal = SMSJournal(self.journal_file)
+        sms_cli.send_sms = MagicMock(return_value=None)
+
+        sms_cli.run()
+
+        eq_(sms_cli.modem.sms_received, [])
+        eq_(sms_cli.send_sms.call_count, 0)
+
+
+class TestOutbox(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.outbox_file = path.join(self.dir, 'outbox.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def daemon(self, sms_received):
+        sms_cli = FakeSMSCMDDaemon(sms_received=sms_received)
+        sms_cli.outbox = Outbox(self.outbox_file, base_delay=0)
+        sms_cli.modem.set_on_sent(sms_cli.outbox.sent)
+        return sms_cli
+
+    def test_should_keepRepliesAndRunCommand_when_modemFails(self):
+        sms_cli = self.daemon([{'id': 1, 'number': '+34666666666', 'content': 'exec echo "hola"'}])
+        sms_cli.modem.send_errors = 100
+
+        sms_cli.run()
+
+        eq_(sms_cli.modem.sms_flushed, [])
+        eq_(sms_cli.metrics.command_duration.count('exec'), 1)
+        ok_(sms_cli.outbox_retries.get() >= 2)
+        eq_(sms_cli.outbox_pending.get(), 2)
+
+        restarted = self.daemon([])
+        restarted.flush_sms()
+
+        eq_(restarted.modem.sms_flushed, [('+34666666666', 'Executing command: echo "hola"'),
+                                          ('+34666666666', 'Command executed: hola\n')])
+        eq_(len(restarted.outbox), 0)
+        eq_(restarted.outbox_pending.get(), 0)
+        restarted.close_outbox()
+
+    def test_should_replyOutboxState_when_outboxCommandReceived(self):
+        sms_cli = self.daemon([{'id': 1, 'number': '+34666666666', 'content': 'exec echo "hola"'},
+                               {'id': 2, 'number': '+34666666666', 'content': 'outbox'}])
+        sms_cli.modem.send_errors = 100
+
+        sms_cli.run()
+
+        outbox = Outbox(self.outbox_file)
+        replies = [text for _, _, text in outbox.due()]
+        outbox.close()
+        eq_(len(replies), 3)
+        ok_(replies[2].startswith("Outbox: 2 pending, oldest 0s, 2 failed attempts"))
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_should_replyDisabled_when_profilingNotConfigured(self):
+        sms_cli = FakeSMSCMDDaemon(sms_received=[{'id': 1, 'number': '+34666666666', 'content': 'profile cpu'}])
+        sms_cli.send_sms = MagicMock(return_value=None)
+
+        sms_cli.run()
+
+        eq_(sms_cli.send_sms.call_args_list, [call('+34666666666', 'Profiling: cpu'),
+                                              call('+34666666666', 'Profiling disabled')])
+
+    def test_should_toggleProfiler_when_profileCommandReceived(self):
+        sms_cli = FakeSMSCMDDaemon(sms_received=[{'id': 1, 'number': '+34666666666', 'content': 'profile cpu'}])
+        sms_cli.profiler = Profiler(self.dir)
+        sms_cli.send_sms = MagicMock(return_value=None)
+
+        sms_cli.run()
+        sms_cli.profiler.toggle_cpu()
+
+        eq_(sms_cli.send_sms.call_args_list[-1], call('+34666666666', 'CPU profiling started'))
+        eq_(len(os.listdir(self.dir)), 1)
+
+
+class TestReload(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.config_file = path.join(self.dir, 'sms.yaml')
+        shutil.copy(config_file, self.config_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def reload(self, sms_cli, text):
+        with open(self.config_file, 'w') as f:
+            f.write(text)
+        sms_cli.reloader.request()
+        sms_cli.reloader.wait(5)
+        return sms_cli.reload_config()
+
+    def test_should_swapPhonesAndCommands_when_configReloaded(self):
+        sms_cli = FakeSMSCMDDaemon(config_file=self.config_file)
+        with open(config_file) as f:
+            text = f.read().replace("authorized: ['+34666666666'", "authorized: ['+34777777777', '+34666666666'")
+
+        ok_(not self.reload(sms_cli, text))
+
+        ok_(sms_cli.check_authorized_phone('+34777777777'))
+        eq_(sms_cli.config_reloads.get('ok'), 1)
+
+    def test_should_keepPreviousConfig_when_groupHasUnknownCommand(self):
+        sms_cli = FakeSMSCMDDaemon(config_file=self.config_file)
+        sms_cli.send_sms = MagicMock(return_value=None)
+        with open(config_file) as f:
+            text = f.read().replace("commands: [public_ip, status]", "commands: [public_ip, reboot]")
+
+        ok_(self.reload(sms_cli, text))
+
+        eq_(sms_cli.send_sms.call_args_list,
+            [call(phone, 'Config reload failed, keeping previous config: Phone groups: unknown commands reboot')
+             for phone in sms_cli.alerts_phones])
+
+    def test_should_keepPreviousConfigAndAlert_when_configInvalid(self):
+        sms_cli = FakeSMSCMDDaemon(config_file=self.config_file)
+        sms_cli.send_sms = MagicMock(return_value=None)
+        commands = sms_cli.commands
+        with open(config_file) as f:
+            text = f.read().replace("{command_output}", "{command_unknown}")
+
+        ok_(self.reload(sms_cli, text))
+
+        ok_(sms_cli.commands is commands)
+        eq_(sms_cli.config_reloads.get('error'), 1)
+        eq_(sms_cli.send_sms.call_args_list,
+            [call(phone, 'Config reload failed, keeping previous config: '
+                         'Command public_ip: Unknown field {command_unknown}')
+             for phone in sms_cli.alerts_phones])
+
+
 class TestSMSCli(unittest.TestCase):
 
     def test_should_returnTrue_when_isAuthorizedPhoneNumber(self):
@@ -180,12 +601,77 @@ class TestSMSCli(unittest.TestCase):
         for phone in no_authorized_phones:
             self.assertRaises(UnauthorizedPhoneNumberException, sms_cli.check_authorized_phone, phone)
 
+    def test_should_authorizePhone_when_numberInOtherFormat(self):
+        sms_cli = FakeSMSCMDDaemon()
+
+        for phone in ('0034666666666', '666666666', '34666666666', '+34 666 666 666'):
+            ok_(sms_cli.check_authorized_phone(phone))
+
+    def test_should_alertForbiddenCommand_when_commandNotInPhoneGroup(self):
+        sms_cli = FakeSMSCMDDaemon(sms_received=[{'id': 1, 'number': '666666668', 'content': 'exec echo "hola"'},
+                                                 {'id': 2, 'number': '666666668', 'content': 'status 1'}])
+        sms_cli.send_sms = MagicMock(return_value=None)
+
+        sms_cli.run()
+
+        eq_(sms_cli.send_sms.call_args_list, [call('+34666666666', 'Command exec not allowed for 666666668'),
+                                              call('666666668', 'Unknown job 1')])
+
+    def test_should_flushQueuedSMS_when_cycleEnds(self):
+        sms_cli = FakeSMSCMDDaemon(sms_received=[{'id': 1, 'number': '+34666666666', 'content': 'exec echo "hola"'},
+                                                 {'id': 2, 'number': '+34666666667', 'content': 'public_ip'}])
+        sms_cli.run()
+
+        eq_(sms_cli.modem.sms_received, [])
+        eq_(sms_cli.modem.sms_queued, [])
+        eq_(sms_cli.modem.sms_flushed, [('+34666666666', 'Executing command: echo "hola"'),
+                                        ('+34666666666', 'Command executed: hola\n'),
+                                        ('+34666666666', 'Unauthorized phone number +34666666667')])
+
+    def test_should_recordMetrics_when_smsProcessed(self):
+        sms_cli = FakeSMSCMDDaemon(sms_received=[{'id': 1, 'number': '+34666666666', 'content': 'exec echo "hola"'},
+                                                 {'id': 2, 'number': '+34666666666', 'content': 'exec exit 1'}])
+        sms_cli.run()
+
+        eq_(sms_cli.metrics.received.get(), 2)
+        eq_(sms_cli.metrics.command_duration.count('exec'), 2)
+        eq_(sms_cli.metrics.command_errors.get('exec'), 1)
+        eq_(sms_cli.metrics.stage_duration.count('authorize'), 2)
+
+    @patch('sms.sms_cmd.capture_output')
+    def test_should_reuseCachedResult_when_commandHasCacheTTL(self, mock_capture_output):
+        mock_capture_output.side_effect = [OutputBuffer.from_bytes(b'127.0.0.1')]
+        sms_cli = FakeSMSCMDDaemon(sms_received=[{'id': 1, 'number': '+34666666666', 'content': 'public_ip'},
+                                                 {'id': 2, 'number': '+34666666666', 'content': 'public_ip'}])
+        sms_cli.send_sms = MagicMock(return_value=None)
+
+        sms_cli.run()
+
+        eq_(mock_capture_output.call_count, 1)
+        eq_(sms_cli.send_sms.call_args_list, [call('+34666666666', 'Getting public IP: public-ip'),
+                                              call('+34666666666', 'Public IP: 127.0.0.1'),
+                                              call('+34666666666', 'Public IP: 127.0.0.1 (cached 0s ago)')])
+
+    @patch('sms.sms_cmd.capture_output')
+    def test_should_notCacheResult_when_commandWithoutCacheTTL(self, mock_capture_output):
+        mock_capture_output.side_effect = [OutputBuffer.from_bytes(b''), OutputBuffer.from_bytes(b'')]
+        sms_cli = FakeSMSCMDDaemon(sms_received=[{'id': 1, 'number': '+34666666666', 'content': 'update_dns'},
+                                                 {'id': 2, 'number': '+34666666666', 'content': 'update_dns'}])
+        sms_cli.send_sms = MagicMock(return_value=None)
+
+        sms_cli.run()
+
+        eq_(mock_capture_output.call_count, 2)
+
     def test_shuold_returnCommand_when_validKey(self):
         sms_cli = FakeSMSCMDDaemon()
         config = load_config(path_config=config_file)
 
         for k, v in config['commands'].items():
-            eq_(sms_cli.get_command(k), v)
+            cmd = sms_cli.get_command(k)
+            eq_(cmd.key, k)
+            eq_(cmd.cli, v.get('cli'))
+            eq_(set(cmd.templates), set(v['msg']))
 
     def test_shuold_throwUnrecognizedCommandException_when_invalidKey(self):
         sms_cli = FakeSMSCMDDaemon()
@@ -195,12 +681,13 @@ class TestSMSCli(unittest.TestCase):
 
     def test_should_returnTrue_when_commandNeedCofirmMessage(self):
         config = load_config(path_config=config_file)
+        commands = CommandRegistry(config['commands'])
         for cmd in ['reboot_computer']:
-            cmd = config['commands'][cmd]
+            cmd = commands[cmd]
             ok_(not SMSCMDDaemon.need_confirm(cmd))
 
         for cmd in ['exec', 'restart_current_meter', 'update_dns']:
-            cmd = config['commands'][cmd]
+            cmd = commands[cmd]
             ok_(SMSCMDDaemon.need_confirm(cmd))
 
     def test_should_returnCustomCmd_when_sendSMSwithExecCmd(self):
@@ -209,7 +696,8 @@ class TestSMSCli(unittest.TestCase):
         content = 'exec ' + cli_expected
         cmd = sms_cli.get_command(content)
 
-        ok_(cmd['cli'] == cli_expected)
+        ok_(cmd.cli == cli_expected)
+        ok_(sms_cli.commands['exec'].cli is None)
 
     def test_should_substituteVarsInMessage_when_commandStartedMsgHasVars(self):
         sms_cli = FakeSMSCMDDaemon()
@@ -217,18 +705,17 @@ class TestSMSCli(unittest.TestCase):
         sms = {'id': 1,
                'number': '+34660045151',
                'content': 'reboot_computer',
-               'command': {
+               'command': Command.from_config('reboot_modem', {
                    'msg': {
                        'started': 'Rebooting modem: {command_cli}',
-                       'finished': 'Modem rebooted: {ouput}',
+                       'finished': 'Modem rebooted: {command_output}',
                        'error': 'Error rebooting modem'
                    },
                    'cli': 'zte_reboot'
+               })
                }
-               }
-        sms_flat = sms_cli.flatten(sms)
 
-        msg_expected = sms['command']['msg']['started'].format(**sms_flat)
+        msg_expected = 'Rebooting modem: zte_reboot'
 
         sms_cli.send_confirm_started(sms)
         ok_(sms_cli.send_sms.call_args == ((sms['number'], msg_expected), ))
@@ -240,20 +727,18 @@ class TestSMSCli(unittest.TestCase):
         sms = {'id': 1,
                'number': '+34660045151',
                'content': 'reboot_computer',
-               'command': {
+               'command': Command.from_config('public_ip', {
                    'msg': {
                        'started': 'Getting public IP',
                        'finished': 'Public IP: {command_output}',
                        'error': 'Error getting public IP'
                    },
-                   'cli': 'zte_reboot',
-                   'output': output
-
-               }
+                   'cli': 'zte_reboot'
+               }),
+               'result': CommandResult(output=output, output_bytes=len(output), truncated_bytes=0)
                }
 
-        sms_flat = sms_cli.flatten(sms)
-        msg_expected = sms['command']['msg']['finished'].format(**sms_flat)
+        msg_expected = 'Public IP: 127.0.0.1'
 
         sms_cli.send_confirm_endend(sms)
         ok_(sms_cli.send_sms.call_args == ((sms['number'], msg_expected), ))